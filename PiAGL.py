@@ -24,8 +24,21 @@ import numpy as np
 import pygame
 from pygame.locals import *
 import os
+from collections import OrderedDict
 from picamera2 import Picamera2
 from libcamera import controls
+from imgproc import zoom_view
+from engine import GuideEngine
+from profiler import Profiler
+from tracker import Tracker
+from capture import FrameGrabber, Rate, picamera_grab
+from mount import SerialWriter
+from telemetry import Telemetry, pulse_ms
+import controller as ctl
+from darks import Darks, DarkBuilder, frame_region
+from settings import Settings, schema
+from v4l2 import Controls, Capture
+from devices import find_camera, find_serial
 
 # v0.05
 
@@ -53,6 +66,18 @@ noise        = 0       # noise reduction *
 binn         = 0       # binning, 0 = none, 1 = 2x2, 2 = 3x3 etc *
 conl         = 90      # Contrast Limit, determines minimum contrast that a star will be detected *
 focus_fitted = 0       # 1 = enabled if focusser fitted eg Meade #1209
+stars        = 1       # stars averaged in the detection window, 1 = brightest only
+track        = 0       # 1 = detection window follows the star (single star only)
+track_crop   = 15      # size of the window when following the star
+Y_only       = 0       # 1 = capture luminance only, YUV420 Y plane on the Pi camera
+usb_format   = 'MJPG'  # USB camera format, 'MJPG' or 'YUYV'
+usb_buffers  = 4       # USB camera driver buffers
+centroid     = 0       # star position, 0 = median, 1 = interpolated median, 2 = weighted, 3 = moments fit
+telemetry    = 1       # 1 = log every frame to PiAGLlog.csv
+guide_mode   = 0       # 0 = average over interval, 1 = proportional, 2 = PID, 3 = hysteresis, 1-3 correct every frame
+aggression   = 0.7     # fraction of the offset corrected each frame, modes 1-3
+dark_on      = 0       # 1 = subtract the master dark and clear hot pixels
+dark_frames  = 20      # frames averaged for a master dark
 
 # USB Webcam presets
 #===================================================================================
@@ -69,54 +94,43 @@ backlight    = 0      # sets it OFF 0-1
 
 # * user adjustable within script whilst running
 
-# check PiAGconfig.txt exists, if not then write default values
-if not os.path.exists('PiAGLconfig.txt'):
-    points = [crop,threshold,scale,fps,mode,speed,Again,brightness,contrast,Auto_G,min_corr,interval,InvRA,InvDEC,preview,c_mask,fullscreen,ev,noise,binn,
-              Auto_Gain,exposure,gain,gamma,red_balance,blue_balance,auto_contour,contour,dnr,backlight,conl]
-    with open('PiAGLconfig.txt', 'w') as f:
-        for item in points:
-            f.write("%s\n" % item)
+# read the saved settings, PiAGLsettings.json, over the defaults above.
+# An old PiAGLconfig.txt is converted the first time.
+store = Settings(defaults={name: globals()[name] for name in schema})
+store.start()
 
-# read PiAGconfig.txt
-config = []
-with open("PiAGLconfig.txt", "r") as file:
-   line = file.readline()
-   while line:
-      config.append(line.strip())
-      line = file.readline()
-config = list(map(int,config))
-
-crop        = config[0]
-threshold   = config[1]
-scale       = config[2]
-fps         = config[3]
-mode        = config[4]
-speed       = config[5]
-ISO         = config[6]
-brightness  = config[7]
-contrast    = config[8]
-Auto_G      = config[9]
-min_corr    = config[10]
-interval    = config[11]
-InvRA       = config[12]
-InvDEC      = config[13]
-preview     = config[14]
-c_mask      = config[15]
-fullscreen  = config[16]
-ev          = config[17]
-noise       = config[18]
-binn        = config[19]
-Auto_Gain   = config[20]
-exposure    = config[21]
-gain        = config[22]
-gamma       = config[23]
-red_balance = config[24]
-blue_balance= config[25]
-auto_contour= config[26]
-contour     = config[27]
-dnr         = config[28]
-backlight   = config[29]
-conl        = config[30]
+crop        = store['crop']
+threshold   = store['threshold']
+scale       = store['scale']
+fps         = store['fps']
+mode        = store['mode']
+speed       = store['speed']
+Again       = store['Again']
+brightness  = store['brightness']
+contrast    = store['contrast']
+Auto_G      = store['Auto_G']
+min_corr    = store['min_corr']
+interval    = store['interval']
+InvRA       = store['InvRA']
+InvDEC      = store['InvDEC']
+preview     = store['preview']
+c_mask      = store['c_mask']
+fullscreen  = store['fullscreen']
+ev          = store['ev']
+noise       = store['noise']
+binn        = store['binn']
+Auto_Gain   = store['Auto_Gain']
+exposure    = store['exposure']
+gain        = store['gain']
+gamma       = store['gamma']
+red_balance = store['red_balance']
+blue_balance= store['blue_balance']
+auto_contour= store['auto_contour']
+contour     = store['contour']
+dnr         = store['dnr']
+backlight   = store['backlight']
+conl        = store['conl']
+guide_mode  = store['guide_mode']
 
 # set variables
 if Pi_Cam == 1:
@@ -145,45 +159,20 @@ RAon = 1
 DECon = 1
 ser_connected = 0
 ser2_connected = 0
-ISO2 = ISO
 focus_speed = 2
 parameters = []
 
 import serial
-if os.path.exists('/dev/ttyACM0') == True:
-    import serial
-    ser = serial.Serial('/dev/ttyACM0', 9600)
-    ser_connected = 1
-elif os.path.exists('/dev/ttyACM1') == True:
-    import serial
-    ser = serial.Serial('/dev/ttyACM1', 9600)
-    ser_connected = 1
-elif os.path.exists('/dev/ttyACM2') == True:
-    import serial
-    ser = serial.Serial('/dev/ttyACM2', 9600)
-    ser_connected = 1
-elif os.path.exists('/dev/ttyACM3') == True:
-    import serial
-    ser = serial.Serial('/dev/ttyACM3', 9600)
+# the Arduino, on the port it was on last time if it's still there
+port = find_serial()
+if port:
+    ser = serial.Serial(port, 9600)
     ser_connected = 1
-time.sleep(2)
+    # all serial output goes through the writer thread, which holds the
+    # first command back until the Arduino has booted
+    writer = SerialWriter(ser, boot=2.0)
+    writer.start()
 
-#===================================================================================
-# Generate mask for Circular window
-#===================================================================================
-if not os.path.exists('/run/shm/CMask.bmp'):
-   pygame.init()
-   bredColor =   pygame.Color(100,100,100)
-   mwidth =200
-   mheight = 200
-   mcrop = 200
-   windowSurfaceObj = pygame.display.set_mode((mwidth, mheight),0, 24)
-   pygame.draw.circle(windowSurfaceObj, bredColor, (int(mcrop/2),int(mcrop/2)), int(mcrop/2),0)
-   pygame.display.update()
-   pygame.image.save(windowSurfaceObj, '/run/shm/CMask.bmp')
-   pygame.display.quit()
-mask = pygame.image.load('/run/shm/CMask.bmp')
-  
 x = int(width/2) - a
 y = int(height/2) - b
 
@@ -214,6 +203,9 @@ yellowColor = pygame.Color(255, 255,   0)
 blueColor   = pygame.Color(  0,   0, 255)
 redColor    = pygame.Color(200,   0,   0)
 
+# screen areas changed since the last display update
+dirty = []
+
 def button(col,row, bColor,x):
    colors = [greyColor, dgryColor, dgryColor, dgryColor, yellowColor]
    Color = colors[bColor]
@@ -224,9 +216,17 @@ def button(col,row, bColor,x):
    pygame.draw.line(windowSurfaceObj,greyColor,(bx+79,by),(bx+79,by+40))
    pygame.draw.line(windowSurfaceObj,whiteColor,(bx,by),(bx,by+39))
    pygame.draw.line(windowSurfaceObj,dgryColor,(bx,by+39),(bx+79,by+39))
-   pygame.display.update(bx, by, 80, 40)
+   dirty.append(Rect(bx, by, 80, 40))
    return
 
+# fonts by size, and rendered labels by (msg,size,colour), least recently used dropped
+font_file = '/usr/share/fonts/truetype/freefont/FreeSerif.ttf'
+if not os.path.exists(font_file):
+    font_file = None
+fonts  = {}
+labels = OrderedDict()
+max_labels = 256
+
 def text(col,row,fColor,top,upd,msg,fsize,bcolor,x):
    colors =  [dgryColor, greenColor, yellowColor, redColor, greenColor, blueColor, whiteColor, greyColor, blackColor, purpleColor]
    Color  =  colors[fColor]
@@ -234,11 +234,19 @@ def text(col,row,fColor,top,upd,msg,fsize,bcolor,x):
    
    bx = x + (col * 80)
    by = row * 40
-   if os.path.exists ('/usr/share/fonts/truetype/freefont/FreeSerif.ttf'): 
-       fontObj =       pygame.font.Font('/usr/share/fonts/truetype/freefont/FreeSerif.ttf', int(fsize))
+   key = (msg,int(fsize),fColor)
+   msgSurfaceObj = labels.get(key)
+   if msgSurfaceObj is None:
+       fontObj = fonts.get(int(fsize))
+       if fontObj is None:
+           fontObj = pygame.font.Font(font_file, int(fsize))
+           fonts[int(fsize)] = fontObj
+       msgSurfaceObj = fontObj.render(msg, False, Color)
+       labels[key] = msgSurfaceObj
+       if len(labels) > max_labels:
+           labels.popitem(last=False)
    else:
-       fontObj =       pygame.font.Font(None, int(fsize))
-   msgSurfaceObj = fontObj.render(msg, False, Color)
+       labels.move_to_end(key)
    msgRectobj =    msgSurfaceObj.get_rect()
    if top == 0:
        pygame.draw.rect(windowSurfaceObj,bColor,Rect(bx+1,by+1,70,20))
@@ -249,85 +257,31 @@ def text(col,row,fColor,top,upd,msg,fsize,bcolor,x):
        
    windowSurfaceObj.blit(msgSurfaceObj, msgRectobj)
    if upd == 1:
-      pygame.display.update(bx, by, 80, 40)
+      dirty.append(Rect(bx, by, 80, 40))
 
 # initialize the camera
 if Pi_Cam == 1:
     # start Pi camera
     picam2 = Picamera2()
-    picam2.configure(picam2.create_preview_configuration(main={"format": 'XRGB8888', "size": (640, 480)}))
+    if Y_only == 1:
+        picam2.configure(picam2.create_preview_configuration(main={"format": 'YUV420', "size": (640, 480)}))
+    else:
+        picam2.configure(picam2.create_preview_configuration(main={"format": 'XRGB8888', "size": (640, 480)}))
     picam2.start()
 else:
-    # find USB camera
-    cam1 = -1
-    x = 0
-    while cam1 == -1 and x < 42:
-        txt = "v4l2-ctl -d " + str(x) + " --list-ctrls > /run/shm/cam_ctrls.txt"
-        os.system(txt)
-        ctrls = []
-        with open("/run/shm/cam_ctrls.txt", "r") as file:
-            line = file.readline()
-            while line:
-                ctrls.append(line)
-                line = file.readline()
-        if 'User Controls\n' in ctrls and ('Camera Controls\n' in ctrls):
-            cam1 = x
-        else:
-            x +=1
-    dve = cam1
+    # find USB camera, the one used last time if it's still there
+    cam1 = find_camera(Controls)
     if cam1 == -1:
         print(" No USB camera found !!")
         exit()
-    import pygame.camera
-    pygame.camera.init()
-    cam = pygame.camera.Camera("/dev/video" + str(cam1), (width,height))
-    cam.start()
+    # frames straight from the driver's buffers, bottom row first
+    cam = Capture(cam1,width,height,usb_format,Y_only == 1,usb_buffers)
 
 def camera_controls():
-    # find camera controls
-    global cam1,parameters
-    txt = "v4l2-ctl -l -d " + str(cam1) + " > /run/shm/cam_ctrls.txt"
-    os.system(txt)
-    config = []
-    with open("/run/shm/cam_ctrls.txt", "r") as file:
-        line = file.readline()
-        while line:
-            config.append(line.strip())
-            line = file.readline()
-    parameters = []
-    for x in range(0,len(config)):
-        fet = config[x].split(' ')
-        name = ""
-        minm = -1
-        maxm = -1
-        step = -1
-        defa = -1
-        valu = -1
-        for y in range(0,len(fet)):
-            name = fet[0]
-            if fet[y][0:3] == "min":
-                minm = fet[y][4:]
-            if fet[y][0:3] == "max":
-                maxm = fet[y][4:]
-            if fet[y][0:3] == "ste":
-                step = fet[y][5:]
-            if fet[y][0:3] == "def":
-                defa = fet[y][8:]
-            if fet[y][0:3] == "val":
-                valu = fet[y][6:]
-            if valu != -1 and defa != -1: 
-                parameters.append(name)
-                parameters.append(minm)
-                parameters.append(maxm)
-                parameters.append(step)
-                parameters.append(defa)
-                parameters.append(valu)
-                name = ""
-                minm = -1
-                maxm = -1
-                step = -1
-                defa = -1
-                valu = -1
+    # find camera controls, [name, min, max, step, default, value] for each
+    global ctrls,parameters
+    ctrls = Controls(cam1)
+    parameters = ctrls.parameters()
 
 if Pi_Cam == 0:
     camera_controls()
@@ -354,6 +308,20 @@ if Pi_Cam == 0:
             gamin = int(parameters[d+1])
             gamax = int(parameters[d+2])
 
+# keep the saved settings within what this camera can do
+if Pi_Cam == 1:
+    limits = picam2.camera_controls
+    if "AnalogueGain" in limits:
+        Again = store.limit("Again",0,int(limits["AnalogueGain"][1]))
+    if "ExposureTime" in limits:
+        speed = store.limit("speed",int(limits["ExposureTime"][0]),int(limits["ExposureTime"][1]))
+else:
+    v4l2_names = {'brightness':'brightness','contrast':'contrast','auto_exposure':'Auto_Gain','exposure_time_absolute':'exposure',
+                  'gain':'gain','gamma':'gamma','backlight_compensation':'backlight'}
+    for d in range(0,len(parameters),6):
+        if parameters[d] in v4l2_names:
+            store.limit(v4l2_names[parameters[d]],int(parameters[d+1]),int(parameters[d+2]))
+
 for c in range(0,2):
     for d in range(0,12):
         button(c,d,0,640)
@@ -404,7 +372,6 @@ if Pi_Cam == 1:
         text(0,3,3,1,1,str(int(speed/1000)),18,7,640)
     else:
         text(0,3,0,1,1,str(int(speed/1000)),18,7,640)
-    time.sleep(1)
     if Pi_Cam == 3:
         if v3_f_mode == 0:
             picam2.set_controls({"AfMode": controls.AfModeEnum.Manual, "AfMetering" : controls.AfMeteringEnum.Windows,  "AfWindows" : [(int(vid_width* .33),int(vid_height*.33),int(vid_width * .66),int(vid_height*.66))]})
@@ -428,34 +395,21 @@ if Pi_Cam == 1:
     text(0,2,3,1,1,str(fps),18,7,640)
 
 else:
-    # Philips Webcam initialisation
-    rpistr = "v4l2-ctl -c gain=" + str(gain) + " -d " + str(dve)
-    os.system (rpistr)
-    rpistr = "v4l2-ctl -c backlight_compensation=" + str(backlight) + " -d " + str(dve)
-    os.system(rpistr)
-    
+    # Philips Webcam initialisation, in one call
+    ctrls.set_many(gain=gain,backlight_compensation=backlight,brightness=brightness,contrast=contrast)
+
     text(1,1,5,0,1,"Gain",14,7,640)
     text(1,1,3,1,1,str(gain),18,7,640)
     text(1,3,5,0,1,"Auto Gain",14,7,640)
     text(1,3,3,1,1,str(Auto_Gain),18,7,640)
-    path = "v4l2-ctl -c gain_automatic=" + str(Auto_Gain) + " -d " + str(dve)
-    os.system(rpistr)
     text(0,3,5,0,1,"Exposure",14,7,640)
     text(0,3,3,1,1,str(exposure),18,7,640)
-    path = "v4l2-ctl -c exposure=" + str(exposure) + " -d " + str(dve)
-    os.system(rpistr)
     text(0,2,5,0,1,"Con Limit",14,7,640)
     text(0,2,3,1,1,str(conl),18,7,640)
     text(0,4,5,0,1,"Brightness",14,7,640)
     text(0,4,3,1,1,str(brightness),18,7,640)
-    path = "v4l2-ctl -c brightness=" + str(brightness) + " -d " + str(dve)
-    os.system (path)
-    path = "v4l2-ctl -c contrast=" + str(contrast) + " -d " + str(dve)
-    os.system (path)
     text(1,4,5,0,1,"Contrast",14,7,640)
     text(1,4,3,1,1,str(contrast),18,7,640)
-
-    os.system (path)
 text(0,5,2,0,1,"RA offset",14,7,640)
 text(0,5,3,1,1,str(xo),18,7,640)
 text(1,5,2,0,1,"DEC offset",14,7,640)
@@ -499,6 +453,22 @@ if binn == 0:
 else:
     text(1,10,3,1,1,str(binn+1) + "x" + str(binn+1),18,7,640)
 text(1,11,2,0,1,"  EXIT ",14,7,640)
+text(0,11,2,0,1,"Loop FPS",14,7,0)
+button(2,11,0,0)
+text(2,11,2,0,1,"Profile",14,7,0)
+text(2,11,3,1,1,"off",18,7,0)
+button(0,10,0,0)
+text(0,10,2,0,1,"Take darks",14,7,0)
+button(1,10,0,0)
+text(1,10,2,0,1,"Darks",14,7,0)
+text(1,10,3,1,1,"off",18,7,0)
+button(3,11,0,0)
+text(3,11,2,0,1,"Guide mode",14,7,0)
+text(3,11,3,1,1,ctl.names[guide_mode],18,7,0)
+if Pi_Cam == 1:
+    button(2,10,0,0)
+    text(2,10,2,0,1,"Sensor ROI",14,7,0)
+    text(2,10,3,1,1,"off",18,7,0)
 
 w = widths[zoom]
 h = int(w/1.7647)
@@ -506,173 +476,250 @@ x = int((w/2) - 320 + xo)
 y = int((h/2) - 181 + yo)
 dim = (w, h)
 threshold2 = 0
-ar6 = np.zeros((crop*2,crop*2), np.uint16)
+engine = GuideEngine()
+# stage timings, shown over the video and saved to PiAGLprofile.csv/.json
+prof = Profiler()
+engine.prof = prof
+tracker = Tracker(track_crop)
+prof_lines = []
+# per frame guide log, written to PiAGLlog.csv in the background
+log = Telemetry('PiAGLlog.csv')
+if telemetry == 1:
+    log.start()
+
+def profile_overlay():
+    global prof_lines
+    if capture % 10 == 0 or not prof_lines:
+        fontObj = fonts.get(12)
+        if fontObj is None:
+            fontObj = pygame.font.Font(font_file, 12)
+            fonts[12] = fontObj
+        lines = ["stage  p50 p95 mS", "fps %s" % loop_fps]
+        for stage,st in prof.stats().items():
+            lines.append("%s %.1f %.1f" % (stage,st[0],st[1]))
+        prof_lines = [fontObj.render(line, False, yellowColor, blackColor) for line in lines]
+    for i in range(0,len(prof_lines)):
+        windowSurfaceObj.blit(prof_lines[i], (4, 4 + i * 13))
+
+def save_settings():
+    store.update(**{name: globals()[name] for name in schema})
 
 def lx200(RAstr,DECstr):
    if ser_connected:
-      ser.write(bytes(RAstr.encode('ascii')))
-      time.sleep(0.1)
-      ser.write(bytes(DECstr.encode('ascii')))
+      writer.guide(RAstr)
+      writer.guide(DECstr)
    return
    
+# Pi camera guide mode, the ISP crops the sensor to the area under the view
+# and delivers it at full output size, instead of the software zoom
+# enlarging the whole field. The view geometry, a, b and scale are unchanged.
+roi_guide = 0
+roi_key   = None
+full_crop = None
+
+def sensor_roi():
+    global full_crop,roi_key,settle
+    if full_crop is None:
+        full_crop = picam2.capture_metadata()['ScalerCrop']
+    fx = 640 / w
+    fy = 480 / h
+    kx = full_crop[2] / 640
+    ky = full_crop[3] / 480
+    roi = (int(full_crop[0] + x * fx * kx), int(full_crop[1] + y * fy * ky), int(640 * fx * kx), int(362 * fy * ky))
+    picam2.set_controls({"ScalerCrop": roi})
+    roi_key = (zoom,x,y)
+    # skip the frames already in flight with the old crop
+    settle = time.monotonic() + 3 / fps
+
+# master darks, one per camera setting, taken with the scope covered
+darks = Darks()
+dark_build = None
+dark_armed = 0   # Take darks pressed once, waiting for the lens to be capped
+
+def dark_key():
+    if Pi_Cam == 1:
+        readout = "full"
+        if roi_guide == 1:
+            readout = "roi%d-%d-%d" % roi_key
+        return ("picam", speed if mode == 0 else "auto", Again, readout, "Y" if Y_only else "RGB")
+    return ("video%d" % cam1, exposure, gain, "%dx%d" % (width,height), "Y" if Y_only else "RGB")
+
+def take_button():
+    if dark_armed == 1:
+        button(0,10,1,0)
+        text(0,10,3,0,1,"Capped?",14,0,0)
+        text(0,10,3,1,1,"press",18,0,0)
+    else:
+        button(0,10,0,0)
+        text(0,10,2,0,1,"Take darks",14,7,0)
+
+def dark_button():
+    if dark_build:
+        button(1,10,1,0)
+        text(1,10,1,0,1,"Darks",14,0,0)
+        text(1,10,1,1,1,str(dark_build.count),18,0,0)
+    elif dark_on == 1:
+        button(1,10,1,0)
+        text(1,10,1,0,1,"Darks",14,0,0)
+        text(1,10,1,1,1,"on",18,0,0)
+    else:
+        button(1,10,0,0)
+        text(1,10,2,0,1,"Darks",14,7,0)
+        text(1,10,3,1,1,"off",18,7,0)
+
+# capture runs in its own thread, the loop always takes the newest frame
+# frames are stamped with the time their exposure started
+if Pi_Cam == 1:
+    if Y_only == 1:
+        # Y plane is the top 480 rows of the YUV420 buffer
+        grabber = FrameGrabber(picamera_grab(picam2,480,640),stamped=True)
+    else:
+        grabber = FrameGrabber(picamera_grab(picam2),stamped=True)
+else:
+    def usb_grab():
+        frame = cam.read()
+        # exposure is in 100uS
+        return frame, cam.stamp - exposure / 10000
+    grabber = FrameGrabber(usb_grab,stamped=True)
+grabber.start()
+# show the whole panel once, after that only changed areas are updated
+pygame.display.update()
+dirty.clear()
+rate = Rate()
+loop_fps = ""
+settle = 0
+
 capture = 0
-xtotal  = 0
-ytotal  = 0
 while True:
-    frames +=1
+    if roi_guide == 1 and roi_key != (zoom,x,y):
+        sensor_roi()
+    prof.start()
+    # wait for a frame taken after the last correction has been sent
+    t_frame,img = grabber.latest(settle)
+    if img is None:
+        pygame.display.update(dirty)
+        dirty.clear()
+        pygame.event.pump()
+        continue
+    prof.lap('capture')
     capture +=1
-    time.sleep(0.25)
-    if Pi_Cam == 1:
-        # GET AN IMAGE from Pi camera
-        img = picam2.capture_array("main")
-        image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    else:
-        img = cam.get_image()
-        image = pygame.surfarray.array3d(img)
-        image =  np.rot90(image, 1, (0,1))
     if threshold == 0:
         text(1,0,0,1,1,str(int(threshold2)),18,7,640)
-    resized = cv2.resize(image, dim, interpolation = cv2.INTER_AREA)
-    cropped = resized[y:y+362,x:x+640]
-    crop2 = cropped[(0-b)-crop:(0-b)+crop,a-crop:a+crop]
-    gray = cv2.cvtColor(crop2,cv2.COLOR_RGB2GRAY)
-    if c_mask == 1:
-        smask = pygame.transform.scale(mask, [crop*2, crop*2])
-        img = pygame.surfarray.array3d(smask)
-        new_img = img[:, :, 0]
-        new_img[new_img > 50] = 1
-        gray = gray * new_img
-    if binn > 0:
-        for x1 in range (binn , (crop*2)-binn):
-            for y1 in range (binn , (crop*2)-binn):
-                ar6[x1][y1] = np.sum(gray[x1-binn:x1+1,y1-binn:y1+1])
-        if np.max(ar6) > 255:
-            ar6[ar6 >= 255] = 255
-        gray = ar6
-    backtorgb = cv2.cvtColor(gray,cv2.COLOR_GRAY2RGB)
+    # window for this frame, around the predicted star when following it
+    if track == 1 and stars == 1:
+        wa,wb,wcrop = tracker.window(a,b,crop)
+    else:
+        wa,wb,wcrop = a,b,crop
+    if dark_build:
+        if dark_build.add(img):
+            master,hot = dark_build.master()
+            darks.save(dark_key(),master)
+            print("master dark saved,",hot,"hot pixels")
+            dark_build = None
+            dark_on = 1
+        dark_button()
+    elif dark_on == 1 and darks.select(dark_key()):
+        # only the frame under the detection window is corrected
+        if roi_guide == 1:
+            darks.apply(img,frame_region(img.shape,wa,wb,wcrop,(640,362),0,0))
+        else:
+            darks.apply(img,frame_region(img.shape,wa,wb,wcrop,dim,x,y))
+        prof.lap('dark')
+    # only the 640x362 view is resized, the detection window is cut from it
+    if roi_guide == 1:
+        cropped = zoom_view(img, (640,362), 0, 0)
+    else:
+        cropped = zoom_view(img, dim, x, y)
+    prof.lap('resize')
+    if Pi_Cam == 1 and Y_only == 0:
+        cropped = cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)
+        prof.lap('colour')
+    engine.configure(crop=wcrop,threshold=threshold,binn=binn,noise=noise,c_mask=c_mask,centroid=centroid,conl=conl,
+                     min_corr=min_corr,scalex=scalex,interval=interval,InvRA=InvRA,InvDEC=InvDEC,RAon=RAon,DECon=DECon,Auto_G=Auto_G,stars=stars,
+                     guide_mode=guide_mode,aggression=aggression)
+    gray = engine.window(cropped,wa,wb)
+    prof.lap('window')
+    r = engine.process(gray,(wa - a,b - wb))
+    if track == 1:
+        tracker.update(r.found,a + r.acorrect,b - r.bcorrect)
+    threshold2 = r.threshold
     if preview == 1:
+        backtorgb = cv2.cvtColor(r.raw,cv2.COLOR_GRAY2RGB)
         imageq = pygame.surfarray.make_surface(backtorgb)
         imageq = pygame.transform.rotate(imageq,90)
         imageq = pygame.transform.scale(imageq, [120,120])
-    min_p = np.min(gray)
-    max_p = np.max(gray)
-    if threshold > 0:
-        threshold2 = threshold
-    else:
-        threshold2 = ((max_p - min_p) + min_p) *.66
-    gray[gray <  threshold2] = 0
-    gray[gray >= threshold2] = 1
-    ttot = np.sum(gray)
-    if noise > 0:
-        for x1 in range (noise , (crop*2)-noise):
-            for y1 in range (noise , (crop*2)-noise):
-                ar6[x1][y1] = np.sum(gray[x1-noise:x1,y1-noise:y1])
-        cx = int(noise*noise)
-        ar6[ar6 < cx] = 0
-        ar6[ar6 >= cx] = 1
-        gray = ar6
-        ttot = np.sum(gray)
-    if preview == 1:
-        gray2 = gray[:] * 255
+        gray2 = r.lit * 255
         backtorgb = cv2.cvtColor(gray2,cv2.COLOR_GRAY2RGB)
         backtorgb[:, :, 2:] = 0
         imagep = pygame.surfarray.make_surface(backtorgb)
         imagep = pygame.transform.rotate(imagep,90)
-    column_sums = gray.sum(axis=0)
-    row_sums = gray.sum(axis=1)
-    acorrect = 0
-    atot = 0
-    while atot < int(ttot/2):
-      atot += column_sums[acorrect]
-      acorrect +=1
-    bcorrect = 0
-    btot = 0
-    while btot < int(ttot/2):
-      btot += row_sums[bcorrect]
-      bcorrect +=1
-    acorrect -= int(crop)
-    bcorrect -= int(crop)
-    xcorrect = acorrect
-    ycorrect = bcorrect
-    if InvRA == 1:
-       xcorrect = 0 - xcorrect
-    if InvDEC == 1:
-       ycorrect = 0 - ycorrect
-    xtotal += xcorrect
-    ytotal += ycorrect
-    update = 0
-    RAstr  = ":Mge0000"
-    DECstr = ":Mgn0000"
     if RAon == 1:
         text(0,9,1,1,1," ",16,7,640)
     if DECon == 1:
         text(1,9,1,1,1," ",16,7,640)
-    if abs(xcorrect) > min_corr/scalex and ttot > 10 and (max_p - min_p) > conl and ttot < (crop * crop) and RAon == 1:
-        if xcorrect < 0:
-            RAstr = ":Mge" + ("0000" + str(int(abs(xcorrect) * scalex)))[-4:]
-        else:
-            RAstr = ":Mgw" + ("0000" + str(int(xcorrect * scalex)))[-4:]
+    if r.RAstr:
         if Auto_G == 1:
-            text(0,9,1,1,1,RAstr[3:8],16,7,640)
-        else:
-            text(0,9,9,1,1,RAstr[3:8],16,7,640)
-        update = 1
-  
-    if abs(ycorrect) > min_corr/scalex  and ttot > 10 and (max_p - min_p) > conl and ttot < (crop * crop) and DECon == 1:
-        if ycorrect < 0:
-            DECstr = ":Mgn" + ("0000" + str(int(abs(ycorrect) * scalex)))[-4:]
+            text(0,9,1,1,1,r.RAstr[3:8],16,7,640)
         else:
-            DECstr = ":Mgs" + ("0000" + str(int(ycorrect * scalex)))[-4:]
+            text(0,9,9,1,1,r.RAstr[3:8],16,7,640)
+    if r.DECstr:
         if Auto_G == 1:
-            text(1,9,1,1,1,DECstr[3:8],16,7,640)
+            text(1,9,1,1,1,r.DECstr[3:8],16,7,640)
         else:
-            text(1,9,9,1,1,DECstr[3:8],16,7,640)
-        update = 1
-    RAstr  = ":Mge0000"
-    DECstr = ":Mgn0000"
-    if frames > interval and Auto_G == 1:
-        if abs(xtotal/frames) > min_corr/scalex and RAon == 1 and ttot > 10 and (max_p - min_p) > conl and ttot < (crop * crop):
-            if xtotal < 0:
-                RAstr = ":Mge" + ("0000" + str(int(abs(xtotal/frames) * scalex)))[-4:]
-            else:
-                RAstr = ":Mgw" + ("0000" + str(int((xtotal/frames) * scalex)))[-4:]
-        if abs(ytotal/frames) > min_corr/scalex and DECon == 1 and ttot > 10 and (max_p - min_p) > conl and ttot < (crop * crop):
-            if ytotal < 0:
-                DECstr = ":Mgn" + ("0000" + str(int(abs(ytotal/frames) * scalex)))[-4:]
-            else:
-                DECstr = ":Mgs" + ("0000" + str(int((ytotal/frames) * scalex)))[-4:]
-        if RAstr  != ":Mge0000" or DECstr != ":Mgn0000":
-            correct = RAstr+DECstr
-            if ser_connected:
-               lx200(RAstr,DECstr)
-            time.sleep(0.35)
-        xtotal = 0
-        ytotal = 0
-        frames = 0
-    imagez = pygame.surfarray.make_surface(cropped)
+            text(1,9,9,1,1,r.DECstr[3:8],16,7,640)
+    ra_ms = dec_ms = 0
+    if r.commands:
+        RAstr,DECstr = r.commands
+        correct = RAstr+DECstr
+        if ser_connected:
+           lx200(RAstr,DECstr)
+           ra_ms = pulse_ms(RAstr)
+           dec_ms = pulse_ms(DECstr)
+        settle = engine.settle(r,writer.settled() if ser_connected else time.monotonic())
+    if telemetry == 1:
+        log.record(t_frame,r.acorrect,r.bcorrect,r.flux,r.quality,r.threshold,r.found,ra_ms,dec_ms,time.monotonic() - t_frame)
+    prof.lap('labels')
+    if cropped.ndim == 2:
+        # luminance only, expanded to RGB just for the view drawn
+        imagez = pygame.surfarray.make_surface(cv2.cvtColor(cropped,cv2.COLOR_GRAY2RGB))
+    else:
+        imagez = pygame.surfarray.make_surface(cropped)
     imagez = pygame.transform.rotate(imagez,90)
-    windowSurfaceObj.blit(imagez, (0, 0))
+    dirty.append(windowSurfaceObj.blit(imagez, (0, 0)))
     if preview == 1:
         imagep.set_colorkey(0, pygame.RLEACCEL)
-        windowSurfaceObj.blit(imagep, (a-crop,b-crop))
-        windowSurfaceObj.blit(imageq, (400,363))
+        windowSurfaceObj.blit(imagep, (wa-wcrop,wb-wcrop))
+        dirty.append(windowSurfaceObj.blit(imageq, (400,363)))
     if DECon == 1:
-        pygame.draw.rect(windowSurfaceObj, (200,200,200), Rect(a - crop,b - int(min_corr/scalex) ,crop*2,2*int(min_corr/scalex)), 1)
+        dirty.append(pygame.draw.rect(windowSurfaceObj, (200,200,200), Rect(a - crop,b - int(min_corr/scalex) ,crop*2,2*int(min_corr/scalex)), 1))
     if RAon == 1:
-        pygame.draw.rect(windowSurfaceObj, (200,200,200), Rect(a  - int(min_corr/scalex),b - crop ,2*int(min_corr/scalex),crop*2), 1)
+        dirty.append(pygame.draw.rect(windowSurfaceObj, (200,200,200), Rect(a  - int(min_corr/scalex),b - crop ,2*int(min_corr/scalex),crop*2), 1))
     if c_mask == 1:
-        pygame.draw.circle(windowSurfaceObj,(0,255,0), (a,b),crop,2)
+        pygame.draw.circle(windowSurfaceObj,(0,255,0), (wa,wb),wcrop,2)
     else:
-        pygame.draw.rect(windowSurfaceObj, (0,255,0), Rect(a  - crop,b - crop ,crop*2,crop*2), 2)
-    if ttot > 10 and (max_p - min_p) > conl and ttot < (crop * crop):
+        pygame.draw.rect(windowSurfaceObj, (0,255,0), Rect(wa  - wcrop,wb - wcrop ,wcrop*2,wcrop*2), 2)
+    if r.found:
         if Auto_G == 1:
-            pygame.draw.rect(windowSurfaceObj, (255,0,0), Rect(a + acorrect-2,b - bcorrect-2,4,4), 1)
+            pygame.draw.rect(windowSurfaceObj, (255,0,0), Rect(int(a + r.acorrect)-2,int(b - r.bcorrect)-2,4,4), 1)
         else:
-            pygame.draw.rect(windowSurfaceObj, (255,0,255), Rect(a + acorrect-2,b - bcorrect-2,4,4), 1)
-    pygame.display.update()
+            pygame.draw.rect(windowSurfaceObj, (255,0,255), Rect(int(a + r.acorrect)-2,int(b - r.bcorrect)-2,4,4), 1)
+    fps_str = "%.1f" % rate.tick()
+    if fps_str != loop_fps:
+        loop_fps = fps_str
+        text(0,11,3,1,1,loop_fps,18,7,0)
+    if prof.enabled:
+        profile_overlay()
+    prof.lap('render')
+    pygame.display.update(dirty)
+    dirty.clear()
+    prof.lap('display')
+    prof.total()
 
     for event in pygame.event.get():
        if event.type == QUIT:
+           if telemetry == 1:
+               log.stop()
+           store.stop()
            pygame.quit()
 
        elif (event.type == MOUSEBUTTONUP):
@@ -680,86 +727,107 @@ while True:
            if mousex > crop and mousex < (640-crop) and mousey > crop and mousey < (362-crop):
                a = mousex
                b = mousey
-           if mousex < 400 and mousey > 320 and ser_connected == 1:
+           if mousex < 400 and mousey > 320:
                e = int((mousex)/40)
                f = int(mousey/40)
                g = (f*10) + e
                #print (g)
-               if g == 97:
+               if (g == 104 or g == 105) and Pi_Cam == 1:
+                   roi_guide +=1
+                   if roi_guide > 1:
+                       roi_guide = 0
+                       if full_crop is not None:
+                           picam2.set_controls({"ScalerCrop": full_crop})
+                       settle = time.monotonic() + 3 / fps
+                       button(2,10,0,0)
+                       text(2,10,2,0,1,"Sensor ROI",14,7,0)
+                       text(2,10,3,1,1,"off",18,7,0)
+                   else:
+                       roi_key = None
+                       button(2,10,1,0)
+                       text(2,10,1,0,1,"Sensor ROI",14,0,0)
+                       text(2,10,1,1,1,"guide",18,0,0)
+               elif g == 114 or g == 115:
+                   if prof.enabled:
+                       prof.export('PiAGLprofile')
+                       prof.enabled = False
+                       button(2,11,0,0)
+                       text(2,11,2,0,1,"Profile",14,7,0)
+                       text(2,11,3,1,1,"off",18,7,0)
+                   else:
+                       prof.reset()
+                       prof_lines = []
+                       prof.enabled = True
+                       button(2,11,1,0)
+                       text(2,11,1,0,1,"Profile",14,0,0)
+                       text(2,11,1,1,1,"on",18,0,0)
+               elif g == 100 or g == 101:
+                   # the first press asks for the lens cap, the second starts
+                   if dark_build:
+                       dark_build = None
+                   elif dark_armed == 0:
+                       dark_armed = 1
+                   else:
+                       dark_armed = 0
+                       dark_build = DarkBuilder(dark_frames)
+                   take_button()
+                   dark_button()
+               elif g == 102 or g == 103:
+                   if dark_build is None:
+                       dark_on +=1
+                       if dark_on > 1:
+                           dark_on = 0
+                           dark_button()
+                       elif not darks.select(dark_key()):
+                           # none for these settings, frames of the sky would take the stars out
+                           dark_on = 0
+                           print("No master dark for these settings, cap the lens and use Take darks")
+                           dark_button()
+                           text(1,10,3,1,1,"none",18,7,0)
+                       else:
+                           dark_button()
+               elif g == 116 or g == 117:
+                   guide_mode +=1
+                   if guide_mode >= len(ctl.names):
+                       guide_mode = 0
+                   text(3,11,3,1,1,ctl.names[guide_mode],18,7,0)
+               elif ser_connected == 0:
+                   pass
+               elif g == 97:
                    RAstr = "#:Mgn0250"
-                   ser.write(bytes(RAstr.encode('ascii')))
-                   time.sleep(.25)
+                   writer.send(RAstr,.25)
                elif g == 96:
                    RAstr = "#:Mgs0250"
-                   ser.write(bytes(RAstr.encode('ascii')))
-                   time.sleep(.25)
+                   writer.send(RAstr,.25)
                elif g == 99 and focus_fitted:
                    RAstr = "#:FP+00250"
-                   ser.write(bytes(RAstr.encode('ascii')))
+                   writer.send(RAstr)
                elif g == 98 and focus_fitted:
                    RAstr = "#:FP-00250"
-                   ser.write(bytes(RAstr.encode('ascii')))
+                   writer.send(RAstr)
                elif g == 107:
                    RAstr = "#:Mge0250"
-                   ser.write(bytes(RAstr.encode('ascii')))
-                   time.sleep(.25)
+                   writer.send(RAstr,.25)
                elif g == 106:
                    RAstr = "#:Mgw0250"
-                   ser.write(bytes(RAstr.encode('ascii')))
-                   time.sleep(.25)
+                   writer.send(RAstr,.25)
                elif g == 108 and focus_fitted:
                    focus_speed -=1
                    if focus_speed < 1:
                        focus_speed = 1
                    text(4,10,2,1,1,str(focus_speed),14,7,0)
                    RAstr = "#:F" + str(focus_speed)
-                   ser.write(bytes(RAstr.encode('ascii')))
+                   writer.send(RAstr)
                elif g == 109 and focus_fitted:
                    focus_speed +=1
                    if focus_speed > 4:
                        focus_speed = 4
                    text(4,10,2,1,1,str(focus_speed),14,7,0)
                    RAstr = "#:F" + str(focus_speed)
-                   ser.write(bytes(RAstr.encode('ascii')))
+                   writer.send(RAstr)
 
-               # save config
-               config[0]  = crop
-               config[1]  = threshold
-               config[2]  = scale 
-               config[3]  = fps
-               config[4]  = mode
-               config[5]  = speed
-               config[6]  = ISO
-               config[7]  = brightness
-               config[8]  = contrast
-               config[9] = Auto_G
-               config[10] = min_corr
-               config[11] = interval
-               config[12] = InvRA
-               config[13] = InvDEC
-               config[14] = preview
-               config[15] = c_mask
-               config[16] = fullscreen
-               config[17] = ev
-               config[18] = noise
-               config[19] = binn
-               config[20] = Auto_Gain
-               config[21] = exposure
-               config[22] = gain
-               config[23] = gamma
-               config[24] = red_balance
-               config[25] = blue_balance
-               config[26] = auto_contour
-               config[27] = contour
-               config[28] = dnr
-               config[29] = backlight
-               config[30] = conl
-
-
-               with open('PiAGLconfig.txt', 'w') as f:
-                   for item in config:
-                       f.write("%s\n" % item)
-               time.sleep(.1)
+               # save settings, written in the background once the clicks stop
+               save_settings()
                        
            elif mousex > 640:
                e = int((mousex-640)/40)
@@ -771,12 +839,10 @@ while True:
                    crop = min(crop,180)
                    if a-crop < 1 or b-crop < 1 or a+crop > 640 or b+crop > 360:
                       crop -=1
-                   ar6 = np.zeros((crop*2,crop*2), np.uint16)
                    text(0,7,3,1,1,str(crop),18,7,640)
                elif g == 28:
                    crop -=1
                    crop = max(crop,10)
-                   ar6 = np.zeros((crop*2,crop*2), np.uint16)
                    text(0,7,3,1,1,str(crop),18,7,640)
                elif g == 3:
                    threshold +=1
@@ -853,8 +919,7 @@ while True:
                    else:
                        gain +=1
                        gain = min(gain,gamax)
-                       path = "v4l2-ctl -c gain=" + str(gain) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('gain',gain)
                        text(1,1,3,1,1,str(gain),18,7,640)
                elif (g == 6 and mode != 0) or (g == 6 and Pi_Cam == 0):
                    if Pi_Cam == 1:
@@ -865,8 +930,7 @@ while True:
                    else:
                        gain -=1
                        gain = max(gain,0)
-                       path = "v4l2-ctl -c gain=" + str(gain) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('gain',gain)
                        text(1,1,3,1,1,str(gain),18,7,640)
 
                elif g == 9:
@@ -912,7 +976,7 @@ while True:
                elif g == 13 and mode == 0:
                    if Pi_Cam == 1:
                        speed +=1000
-                       speed = min(speed,6000000)
+                       speed = min(speed,store.limits["speed"][1])
                        picam2.set_controls({"AeEnable": False,"ExposureTime": speed})
                        text(0,3,3,1,1,str(int(speed/1000)),18,7,640)
                        text(0,2,3,1,1,str(fps),18,7,640)
@@ -920,8 +984,7 @@ while True:
                        exposure +=1
                        exposure = min(exposure,exmax)
                        text(0,3,3,1,1,str(exposure),18,7,640)
-                       path = "v4l2-ctl -c exposure_time_absolute=" + str(exposure) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('exposure_time_absolute',exposure)
                elif g == 12 and mode == 0:
                    if Pi_Cam == 1:
                        speed -=1000
@@ -933,12 +996,11 @@ while True:
                        exposure -=1
                        exposure = max(exposure,1)
                        text(0,3,3,1,1,str(exposure),18,7,640)
-                       path = "v4l2-ctl -c exposure_time_absolute=" + str(exposure) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('exposure_time_absolute',exposure)
                elif g == 15 :
                  if Pi_Cam == 1:
                      Again += 1
-                     Again = min(Again,64)
+                     Again = min(Again,store.limits["Again"][1])
                      picam2.set_controls({"AnalogueGain": Again})
                      text(1,3,3,1,1,str(Again),18,7,640)
                  else:
@@ -947,13 +1009,10 @@ while True:
                      if Auto_Gain > agmax:
                          Auto_Gain = 0
                      text(1,3,3,1,1,str(Auto_Gain),18,7,640)
-                     rpistr = "v4l2-ctl -c auto_exposure=" + str(Auto_Gain) + " -d " + str(dve)
-                     os.system(rpistr)
                      if Auto_Gain == 0:
-                         path = "v4l2-ctl -c exposure_time_absolute=" + str(exposure) + " -d " + str(dve)
-                         os.system (path)
-                         path = "v4l2-ctl -c gain=" + str(gain) + " -d " + str(dve)
-                         os.system (path)
+                         ctrls.set_many(auto_exposure=Auto_Gain,exposure_time_absolute=exposure,gain=gain)
+                     else:
+                         ctrls.set('auto_exposure',Auto_Gain)
 
                elif g == 14 :
                  if Pi_Cam == 1:
@@ -966,13 +1025,10 @@ while True:
                      if Auto_Gain < 0:
                          Auto_Gain = 0
                      text(1,3,3,1,1,str(Auto_Gain),18,7,640)
-                     rpistr = "v4l2-ctl -c auto_exposure=" + str(Auto_Gain) + " -d " + str(dve)
-                     os.system(rpistr)
                      if Auto_Gain == 0:
-                         path = "v4l2-ctl -c exposure_time_absolute=" + str(exposure) + " -d " + str(dve)
-                         os.system (path)
-                         path = "v4l2-ctl -c gain=" + str(gain) + " -d " + str(dve)
-                         os.system (path)
+                         ctrls.set_many(auto_exposure=Auto_Gain,exposure_time_absolute=exposure,gain=gain)
+                     else:
+                         ctrls.set('auto_exposure',Auto_Gain)
                    
 
                elif g == 17:
@@ -984,8 +1040,7 @@ while True:
                    if Pi_Cam == 1:
                        picam2.set_controls({"Brightness": brightness/10})
                    else:
-                       path = "v4l2-ctl -c brightness=" + str(brightness) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('brightness',brightness)
                    text(0,4,3,1,1,str(brightness),18,7,640)
                elif g == 16:
                    brightness -=1
@@ -993,8 +1048,7 @@ while True:
                    if Pi_Cam == 1:
                        picam2.set_controls({"Brightness": brightness/10})
                    else:
-                       path = "v4l2-ctl -c brightness=" + str(brightness) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('brightness',brightness)
                    text(0,4,3,1,1,str(brightness),18,7,640)
                elif g == 19:
                    contrast +=1
@@ -1005,8 +1059,7 @@ while True:
                    if Pi_Cam == 1:
                        picam2.set_controls({"Contrast": contrast/10})
                    else:
-                       path = "v4l2-ctl -c contrast=" + str(contrast) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('contrast',contrast)
                    text(1,4,3,1,1,str(contrast),18,7,640)
                elif g == 18:
                    contrast -=1
@@ -1017,8 +1070,7 @@ while True:
                    if Pi_Cam == 1:
                        picam2.set_controls({"Contrast": contrast/10})
                    else:
-                       path = "v4l2-ctl -c contrast=" + str(contrast) + " -d " + str(dve)
-                       os.system (path)
+                       ctrls.set('contrast',contrast)
                    text(1,4,3,1,1,str(contrast),18,7,640)
                elif g == 21:
                    xo +=1
@@ -1077,8 +1129,7 @@ while True:
                        button(0,0,1,640)
                        text(0,0,1,0,1,"AUTO",15,0,640)
                        text(0,0,1,1,1,"GUIDE",15,0,640)
-                       xtotal = 0
-                       ytotal = 0
+                       engine.reset()
                elif g ==44 or g == 45:
                    preview +=1
                    if preview > 1:
@@ -1086,7 +1137,7 @@ while True:
                        button(0,11,0,640)
                        text(0,11,0,0,1,"Preview",14,7,640)
                        text(0,11,0,1,1,"Threshold",13,7,640)
-                       pygame.draw.rect(windowSurfaceObj, (0,0,0), Rect(400,363,120,120), 0)
+                       dirty.append(pygame.draw.rect(windowSurfaceObj, (0,0,0), Rect(400,363,120,120), 0))
                    else:
                        button(0,11,1,640)
                        text(0,11,1,0,1,"Preview",14,0,640)
@@ -1150,41 +1201,10 @@ while True:
                    noise = max(noise,0)
                    text(0,10,3,1,1,str(noise),18,7,640)
                elif g == 46 or g == 47:
+                   if telemetry == 1:
+                       log.stop()
+                   store.stop()
                    pygame.quit()
                        
-               # save config
-               config[0]  = crop
-               config[1]  = threshold
-               config[2]  = scale 
-               config[3]  = fps
-               config[4]  = mode
-               config[5]  = speed
-               config[6]  = Again
-               config[7]  = brightness
-               config[8]  = contrast
-               config[9] = Auto_G
-               config[10] = min_corr
-               config[11] = interval
-               config[12] = InvRA
-               config[13] = InvDEC
-               config[14] = preview
-               config[15] = c_mask
-               config[16] = fullscreen
-               config[17] = ev
-               config[18] = noise
-               config[19] = binn
-               config[20] = Auto_Gain
-               config[21] = exposure
-               config[22] = gain
-               config[23] = gamma
-               config[24] = red_balance
-               config[25] = blue_balance
-               config[26] = auto_contour
-               config[27] = contour
-               config[28] = dnr
-               config[29] = backlight
-               config[30] = conl
-
-               with open('PiAGLconfig.txt', 'w') as f:
-                   for item in config:
-                       f.write("%s\n" % item)
+               # save settings, written in the background once the clicks stop
+               save_settings()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Pi-AGL guiding without a display.
+# Uses the Pi camera and the settings saved by PiAGL.py, locks onto the
+# brightest star in the view and sends LX200 guide pulses to the Arduino.
+# The camera gets the same exposure, gain and image settings as in PiAGL.py.
+
+import time
+import argparse
+from picamera2 import Picamera2
+from libcamera import controls
+from imgproc import zoom_view
+from engine import GuideEngine, pick_star
+from capture import FrameGrabber, Rate, picamera_grab
+from mount import SerialWriter
+import controller as ctl
+from settings import Settings
+from devices import find_serial
+
+widths = [640, 800, 960, 1280, 1620, 1920, 2592, 3280]
+scales = [1, 1.25, 1.5, 2, 2.531, 3, 4.047, 5.125]
+
+parser = argparse.ArgumentParser(description="Pi-AGL headless guider")
+parser.add_argument("--zoom", type=int, default=2)
+parser.add_argument("--fps", type=int, default=0, help="camera fps, 0 = from config")
+parser.add_argument("--mode", choices=ctl.names, default=None, help="guide controller, default from the settings")
+parser.add_argument("--aggression", type=float, default=0.7)
+parser.add_argument("--status", type=int, default=25, help="print status every N frames")
+args = parser.parse_args()
+
+engine = GuideEngine(Auto_G = 1)
+store = Settings()
+scale = store['scale']
+fps = store['fps']
+engine.configure(crop=store['crop'], threshold=store['threshold'], min_corr=store['min_corr'], interval=store['interval'],
+                 InvRA=store['InvRA'], InvDEC=store['InvDEC'], c_mask=store['c_mask'], noise=store['noise'],
+                 binn=store['binn'], conl=store['conl'], guide_mode=store['guide_mode'])
+if args.mode:
+    engine.configure(guide_mode = ctl.names.index(args.mode))
+if args.fps > 0:
+    fps = args.fps
+zoom = args.zoom
+engine.configure(scalex = scale / scales[zoom], aggression = args.aggression)
+w = widths[zoom]
+h = int(w/1.7647)
+x = int((w/2) - 320)
+y = int((h/2) - 181)
+
+writer = None
+port = find_serial()
+if port:
+    import serial
+    writer = SerialWriter(serial.Serial(port, 9600), boot=2.0)
+    writer.start()
+if writer is None:
+    print("No Arduino found, guiding without output")
+
+ae_modes = [None, controls.AeExposureModeEnum.Normal, controls.AeExposureModeEnum.Short, controls.AeExposureModeEnum.Long]
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_preview_configuration(main={"format": 'YUV420', "size": (640, 480)}))
+picam2.start()
+# exposure mode 0 is the manual shutter speed, 1-3 auto exposure
+if store['mode'] == 0:
+    picam2.set_controls({"AeEnable": False, "ExposureTime": store['speed']})
+else:
+    picam2.set_controls({"AeEnable": True, "AeExposureMode": ae_modes[store['mode']]})
+picam2.set_controls({"Brightness": store['brightness']/10, "Contrast": store['contrast']/10,
+                     "ExposureValue": store['ev']/10, "AnalogueGain": store['Again'], "FrameRate": fps})
+grabber = FrameGrabber(picamera_grab(picam2, 480, 640), stamped=True)
+grabber.start()
+
+# the camera can take a few seconds to deliver its first frame
+img = None
+for attempt in range(3):
+    t, img = grabber.latest(timeout=5)
+    if img is not None:
+        break
+    print("Waiting for the camera")
+if img is None:
+    raise SystemExit("No frames from the Pi camera, check it is connected and enabled")
+a, b = pick_star(zoom_view(img, (w, h), x, y), engine.crop)
+print("Guiding on star at", a, b)
+rate = Rate()
+settle = 0
+count = 0
+while True:
+    t, img = grabber.latest(settle)
+    if img is None:
+        continue
+    r = engine.process(engine.window(zoom_view(img, (w, h), x, y), a, b))
+    if r.commands:
+        if writer:
+            writer.guide(r.commands[0])
+            writer.guide(r.commands[1])
+        settle = engine.settle(r, writer.settled() if writer else time.monotonic())
+    count += 1
+    fps_now = rate.tick()
+    if count % args.status == 0:
+        state = "star" if r.found else "lost"
+        print("%5.1f fps  %s  x %6.2f  y %6.2f  snr %6.1f  %s" % (fps_now, state, r.acorrect, r.bcorrect, r.quality,
+                                                                 " ".join(r.commands) if r.commands else ""))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# benchmark the detection pipeline on a recording, no camera or mount needed.
+#   python3 bench.py frames.npy --crop 20,60,180 --zoom 0,2,6 --binn 0,1 --noise 0,2
+# For each combination of settings every frame is run through the view
+# resample, detection window and GuideEngine, and the per stage latency
+# percentiles and the frame rate are printed. Guide commands go to a
+# RecordingSerial, --serial-log keeps them.
+# If the recording has a .truth.csv from starfield.py the centroid error is
+# reported too, and --max-error (rms scatter), --max-bias (constant offset)
+# and --min-fps make the run fail when any is missed, so a speed up that
+# loses accuracy, or the reverse, is caught.
+
+import argparse
+import itertools
+import sys
+import time
+import numpy as np
+from replay import ReplayCamera, RecordingSerial
+from imgproc import zoom_view
+from engine import GuideEngine, pick_star
+from profiler import Profiler
+from starfield import load_truth
+from tracker import Tracker
+
+widths = [640, 800, 960, 1280, 1620, 1920, 2592, 3280]
+scales = [1, 1.25, 1.5, 2, 2.531, 3, 4.047, 5.125]
+
+def ints(text):
+    return [int(v) for v in text.split(',')]
+
+def view_origin(zoom, xo=0, yo=0):
+    w = widths[zoom]
+    h = int(w/1.7647)
+    return (w, h), int((w/2) - 320 + xo), int((h/2) - 181 + yo)
+
+def run(frames, crop, zoom, binn, noise, centroid, ser, truth=None, stars=1, track=0):
+    dim, x, y = view_origin(zoom)
+    fx = frames[0].shape[1] / dim[0]
+    fy = frames[0].shape[0] / dim[1]
+    engine = GuideEngine(crop=crop, binn=binn, noise=noise, centroid=centroid, Auto_G=1, stars=stars,
+                         scalex=100 / scales[zoom])
+    a, b = pick_star(zoom_view(frames[0], dim, x, y), crop)
+    prof = engine.prof = Profiler(size=len(frames), enabled=True)
+    tracker = Tracker(track)
+    found = 0
+    errors = []
+    start = time.perf_counter()
+    for n, img in enumerate(frames):
+        prof.start()
+        view = zoom_view(img, dim, x, y)
+        prof.lap('view')
+        wa, wb, wcrop = a, b, crop
+        if track > 0:
+            wa, wb, wcrop = tracker.window(a, b, crop)
+            engine.configure(crop=wcrop)
+        gray = engine.window(view, wa, wb)
+        prof.lap('window')
+        r = engine.process(gray, (wa - a, b - wb))
+        if track > 0:
+            tracker.update(r.found, a + r.acorrect, b - r.bcorrect)
+        if r.commands:
+            ser.write(r.commands[0].encode('ascii'))
+            ser.write(r.commands[1].encode('ascii'))
+        prof.total()
+        found += r.found
+        if truth is not None and r.found:
+            # true star position in the same terms as acorrect, bcorrect
+            errors.append((r.acorrect - (truth[n][0] / fx - x - a), r.bcorrect - (truth[n][1] / fy - y - (362 - b))))
+    fps = len(frames) / (time.perf_counter() - start)
+    return prof, fps, found, np.array(errors)
+
+# constant offset and rms scatter of the centroid error, view pixels
+def accuracy(errors):
+    if len(errors) == 0:
+        return None, None
+    bias = errors.mean(axis=0)
+    return bias, np.sqrt(((errors - bias)**2).sum(axis=1).mean())
+
+def report(prof):
+    line = ""
+    for stage, s in prof.stats().items():
+        line += "  %s %.2f/%.2f/%.2f" % (stage, s[0], s[1], s[2])
+    return line
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pi-AGL pipeline benchmark")
+    parser.add_argument("recording", help="directory of images, .npy stack or video file")
+    parser.add_argument("--crop", type=ints, default=[60])
+    parser.add_argument("--zoom", type=ints, default=[2])
+    parser.add_argument("--binn", type=ints, default=[0])
+    parser.add_argument("--noise", type=ints, default=[0])
+    parser.add_argument("--centroid", type=ints, default=[0])
+    parser.add_argument("--stars", type=int, default=1, help="stars tracked in the window")
+    parser.add_argument("--track", type=int, default=0, help="follow the star with a window this size, 0 = off")
+    parser.add_argument("--gray", action="store_true", help="replay luminance only")
+    parser.add_argument("--frames", type=int, default=0, help="use only the first N frames")
+    parser.add_argument("--serial-log", default=None)
+    parser.add_argument("--max-error", type=float, default=0, help="fail if rms centroid error, pixels, is over this")
+    parser.add_argument("--max-bias", type=float, default=0, help="fail if the mean centroid offset, pixels, is over this")
+    parser.add_argument("--min-fps", type=float, default=0, help="fail if fps is under this")
+    args = parser.parse_args()
+
+    cam = ReplayCamera(args.recording, gray=args.gray, loop=False)
+    frames = list(cam.frames())
+    if args.frames > 0:
+        frames = frames[:args.frames]
+    truth = load_truth(args.recording)
+    if truth is not None:
+        truth = truth[:len(frames)]
+    ser = RecordingSerial(args.serial_log)
+    failed = False
+    print("%d frames %s, stage p50/p95/p99 mS" % (len(frames), frames[0].shape))
+    for crop, zoom, binn, noise, centroid in itertools.product(args.crop, args.zoom, args.binn, args.noise, args.centroid):
+        prof, fps, found, errors = run(frames, crop, zoom, binn, noise, centroid, ser, truth, args.stars, args.track)
+        acc = ""
+        if truth is not None:
+            bias, rms = accuracy(errors)
+            if rms is None:
+                acc = "  error -"
+                failed |= args.max_error > 0 or args.max_bias > 0
+            else:
+                acc = "  error rms %.3f bias %.2f,%.2f px" % (rms, bias[0], bias[1])
+                failed |= args.max_error > 0 and rms > args.max_error
+                failed |= args.max_bias > 0 and np.hypot(bias[0], bias[1]) > args.max_bias
+        failed |= args.min_fps > 0 and fps < args.min_fps
+        print("crop %3d zoom %d bin %d NR %d cent %d  %7.1f fps  star %3d%%%s%s" % (
+              crop, zoom, binn, noise, centroid, fps, 100 * found // len(frames), acc, report(prof)))
+    ser.close()
+    if failed:
+        print("FAILED")
+        sys.exit(1)
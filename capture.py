@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# camera capture in a background thread.
+# grab() is called continuously and each frame is kept, with the time it
+# arrived, in a small ring buffer. The guiding loop takes the newest frame
+# and any older ones still waiting are dropped.
+# With stamped=True grab() returns (frame, time its exposure started), so a
+# frame exposed while the mount was still moving can be told apart from one
+# that only arrived after it stopped.
+
+import threading
+import time
+from collections import deque
+
+class FrameGrabber(threading.Thread):
+    def __init__(self, grab, size=3, stamped=False):
+        threading.Thread.__init__(self, daemon=True)
+        self.grab    = grab
+        self.stamped = stamped
+        self.frames  = deque(maxlen=size)
+        self.cond    = threading.Condition()
+        self.running = True
+        self.count   = 0
+        self.dropped = 0
+
+    def run(self):
+        while self.running:
+            try:
+                frame = self.grab()
+            except Exception as e:
+                print("capture failed:", e)
+                time.sleep(0.5)
+                continue
+            if self.stamped:
+                frame, t = frame
+            else:
+                t = time.monotonic()
+            with self.cond:
+                if len(self.frames) == self.frames.maxlen:
+                    self.dropped += 1
+                self.frames.append((t, frame))
+                self.count += 1
+                self.cond.notify()
+
+    # newest frame taken after time 'after', or (None, None) on timeout
+    def latest(self, after=0, timeout=1.0):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames and self.frames[-1][0] > after, timeout):
+                return None, None
+            t, frame = self.frames.pop()
+            self.dropped += len(self.frames)
+            self.frames.clear()
+        return t, frame
+
+    def stop(self):
+        self.running = False
+
+# a CLOCK_BOOTTIME time in nS, as libcamera stamps frames, on the
+# time.monotonic() clock
+def from_boottime(ns):
+    return ns / 1e9 - (time.clock_gettime(time.CLOCK_BOOTTIME) - time.monotonic())
+
+# grab for FrameGrabber(stamped=True) from a started Picamera2, frames cut
+# to rows x cols if given. SensorTimestamp is the start of readout, the
+# exposure began ExposureTime before it.
+def picamera_grab(picam2, rows=None, cols=None):
+    def grab():
+        request = picam2.capture_request()
+        try:
+            frame = request.make_array("main")
+            md = request.get_metadata()
+        finally:
+            request.release()
+        if rows:
+            frame = frame[:rows,:cols]
+        return frame, from_boottime(md['SensorTimestamp']) - md.get('ExposureTime', 0) / 1e6
+    return grab
+
+# measured loop rate over the last few frames
+class Rate:
+    def __init__(self, size=20):
+        self.times = deque(maxlen=size)
+
+    def tick(self):
+        self.times.append(time.monotonic())
+        return self.fps()
+
+    def fps(self):
+        if len(self.times) < 2 or self.times[-1] == self.times[0]:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# star position estimators for the detection window.
+# lit is the thresholded 0/1 window, raw the window before thresholding.
+# All return (acorrect, bcorrect, quality, flux), the star position in pixels
+# from the centre of the window (columns, rows), its signal to noise ratio and
+# its summed brightness above the sky.
+# Pixel i covers i to i+1, so a star centred on the window returns 0,0.
+# noise is the window's (sky, sigma) if already known, else it is measured.
+
+import cv2
+import numpy as np
+
+MEDIAN   = 0   # median of lit pixels, whole pixels (original method)
+INTERP   = 1   # median of lit pixels, interpolated within the median pixel
+WEIGHTED = 2   # intensity weighted centroid of the lit pixels, background removed
+MOMENTS  = 3   # gaussian windowed centroid, refined from the second moments
+
+names = ['median', 'interp', 'weighted', 'moments']
+
+# sky level and noise from a histogram of the window, median and MAD
+def hist_sky(hist):
+    cum = np.cumsum(hist)
+    half = cum[-1] / 2
+    med = int(np.searchsorted(cum, half))
+    dev = np.abs(np.arange(len(hist)) - med)
+    mad = np.searchsorted(np.cumsum(np.bincount(dev, weights=hist)), half)
+    return med, max(1.4826 * mad, 1.0)
+
+def sky(raw):
+    return hist_sky(np.bincount(raw.ravel(), minlength=256))
+
+# signal to noise ratio and flux of the lit pixels
+def snr(lit, raw, bg, sigma):
+    n = np.count_nonzero(lit)
+    if n == 0:
+        return 0.0, 0.0
+    flux = max(np.sum(raw, where=lit.astype(bool), dtype=np.float64) - bg * n, 0.0)
+    return flux / (sigma * np.sqrt(n)), flux
+
+def median(lit, raw, crop, ttot, noise=None):
+    half = int(ttot/2)
+    a = b = 0
+    if half > 0:
+        a = int(np.searchsorted(np.cumsum(lit.sum(axis=0)), half)) + 1
+        b = int(np.searchsorted(np.cumsum(lit.sum(axis=1)), half)) + 1
+    bg, sigma = noise or sky(raw)
+    return (a - crop, b - crop) + snr(lit, raw, bg, sigma)
+
+def _interp(sums, half):
+    cs = np.cumsum(sums)
+    i = int(np.searchsorted(cs, half))
+    prev = cs[i-1] if i > 0 else 0
+    return i + (half - prev) / sums[i]
+
+def interp(lit, raw, crop, ttot, noise=None):
+    if ttot <= 0:
+        return 0.0, 0.0, 0.0, 0.0
+    a = _interp(lit.sum(axis=0), ttot/2)
+    b = _interp(lit.sum(axis=1), ttot/2)
+    bg, sigma = noise or sky(raw)
+    return (a - crop, b - crop) + snr(lit, raw, bg, sigma)
+
+def _weighted(lit, raw, bg):
+    wgt = (raw.astype(np.float32) - bg) * lit
+    np.maximum(wgt, 0, out=wgt)
+    tot = wgt.sum()
+    if tot <= 0:
+        return None
+    col = wgt.sum(axis=0)
+    row = wgt.sum(axis=1)
+    pos = np.arange(len(col)) + 0.5
+    a = (col @ pos) / tot
+    b = (row @ pos) / tot
+    var = ((col @ (pos - a)**2) + (row @ (pos - b)**2)) / (2 * tot)
+    return a, b, var
+
+def weighted(lit, raw, crop, ttot, noise=None):
+    bg, sigma = noise or sky(raw)
+    res = _weighted(lit, raw, bg)
+    if res is None:
+        return 0.0, 0.0, 0.0, 0.0
+    return (res[0] - crop, res[1] - crop) + snr(lit, raw, bg, sigma)
+
+def moments(lit, raw, crop, ttot, noise=None, loops=5):
+    bg, sigma = noise or sky(raw)
+    res = _weighted(lit, raw, bg)
+    if res is None:
+        return 0.0, 0.0, 0.0, 0.0
+    a, b, var = res
+    # gaussian of the star's measured width, iterated onto the star centre
+    s2 = max(var, 0.25)
+    n = raw.shape[0]
+    r = int(4 * np.sqrt(s2)) + 2
+    for l in range(loops):
+        x0 = max(int(a) - r, 0)
+        x1 = min(int(a) + r + 1, n)
+        y0 = max(int(b) - r, 0)
+        y1 = min(int(b) + r + 1, n)
+        sub = raw[y0:y1,x0:x1].astype(np.float32) - bg
+        dx = np.arange(x0, x1) + 0.5 - a
+        dy = np.arange(y0, y1) + 0.5 - b
+        g = sub * np.exp(-dy[:,None]**2 / (2*s2)) * np.exp(-dx[None,:]**2 / (2*s2))
+        tot = g.sum()
+        if tot <= 0:
+            break
+        da = 2 * (g.sum(axis=0) @ dx) / tot
+        db = 2 * (g.sum(axis=1) @ dy) / tot
+        a = min(max(a + da, 0.0), float(n))
+        b = min(max(b + db, 0.0), float(n))
+        if abs(da) < 0.01 and abs(db) < 0.01:
+            break
+    return (a - crop, b - crop) + snr(lit, raw, bg, sigma)
+
+estimators = [median, interp, weighted, moments]
+
+def locate(method, lit, raw, crop, ttot, noise=None):
+    return estimators[method](lit, raw, crop, ttot, noise)
+
+# every star in the window, from connected groups of lit pixels.
+# Returns an array of (x, y, snr, flux) rows, brightest first, at most nmax,
+# with x,y intensity weighted in window pixels.
+def detect(lit, raw, nmax, min_area=2, noise=None):
+    n, labels, stats, cents = cv2.connectedComponentsWithStats(lit, connectivity=8)
+    if n <= 1:
+        return np.zeros((0, 4))
+    bg, sigma = noise or sky(raw)
+    wgt = np.maximum(raw.astype(np.float32) - bg, 0).ravel()
+    lab = labels.ravel()
+    rows, cols = np.indices(lit.shape)
+    flux = np.bincount(lab, weights=wgt, minlength=n)
+    sx = np.bincount(lab, weights=wgt * (cols.ravel() + 0.5), minlength=n)
+    sy = np.bincount(lab, weights=wgt * (rows.ravel() + 0.5), minlength=n)
+    area = stats[:,cv2.CC_STAT_AREA]
+    keep = np.nonzero((area >= min_area) & (flux > 0))[0]
+    keep = keep[keep > 0]
+    if len(keep) == 0:
+        return np.zeros((0, 4))
+    keep = keep[np.argsort(-flux[keep])][:nmax]
+    f = flux[keep]
+    return np.column_stack((sx[keep] / f, sy[keep] / f, f / (sigma * np.sqrt(area[keep])), f))
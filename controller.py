@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# guide controllers, one per axis.
+# update(error) takes the star's offset this frame in pixels, after the
+# RA/DEC inversion, and returns the correction to send in pixels, or None
+# when there is nothing to send this frame. The engine applies min_corr,
+# RAon/DECon and turns corrections into pulses.
+# AVERAGE is the original method, the mean offset over 'interval' frames.
+# The others correct every frame, with smaller pulses.
+
+import time
+from collections import deque
+
+AVERAGE      = 0   # mean over interval frames
+PROPORTIONAL = 1   # aggression x offset, every frame
+PID          = 2   # proportional + integral + derivative, every frame
+HYSTERESIS   = 3   # offset low pass filtered with the last correction, every frame
+
+names = ['average', 'prop', 'PID', 'hyst']
+
+class Average:
+    def __init__(self, interval=10, **kw):
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.total  = 0.0
+
+    def update(self, error):
+        self.frames += 1
+        self.total  += error
+        if self.frames > self.interval:
+            mean = self.total / self.frames
+            self.reset()
+            return mean
+        return None
+
+class Proportional:
+    def __init__(self, aggression=0.7, **kw):
+        self.aggression = aggression
+
+    def reset(self):
+        pass
+
+    def update(self, error):
+        return self.aggression * error
+
+# integral over the last 'window' seconds, so it can't wind up while the
+# star is lost or the mount is backlashing. The I and D terms are scaled by
+# the time between updates, so the gains don't change with the frame rate:
+# ki is per second of error and kd is in seconds.
+class Pid:
+    def __init__(self, aggression=0.7, ki=0.5, kd=0.04, window=4.0, clock=time.monotonic, **kw):
+        self.kp     = aggression
+        self.ki     = ki
+        self.kd     = kd
+        self.window = window
+        self.clock  = clock
+        self.past   = deque()
+        self.reset()
+
+    def reset(self):
+        self.past.clear()
+        self.last   = None
+        self.last_t = None
+
+    def update(self, error):
+        t = self.clock()
+        d = 0.0
+        dt = 0.0
+        if self.last is not None and t > self.last_t:
+            # a long gap, eg the star lost, counts as one second
+            dt = min(t - self.last_t, 1.0)
+            d = (error - self.last) / dt
+        self.past.append((t, error * dt))
+        while self.past[0][0] < t - self.window:
+            self.past.popleft()
+        self.last = error
+        self.last_t = t
+        return self.kp * error + self.ki * sum(v for when, v in self.past) + self.kd * d
+
+class Hysteresis:
+    def __init__(self, aggression=0.7, hysteresis=0.1, **kw):
+        self.aggression = aggression
+        self.hysteresis = hysteresis
+        self.reset()
+
+    def reset(self):
+        self.last = 0.0
+
+    def update(self, error):
+        out = (1 - self.hysteresis) * error + self.hysteresis * self.last
+        self.last = out
+        return self.aggression * out
+
+controllers = [Average, Proportional, Pid, Hysteresis]
+
+def make(mode, **kw):
+    return controllers[mode](**kw)
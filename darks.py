@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# dark frame and hot pixel calibration.
+# A master dark is the mean of N frames taken with the scope covered, at the
+# exposure and gain used for guiding. Pixels far above the rest of the dark
+# are hot, and are set to 255 in the master so subtracting it clears them
+# to 0 as well, in one pass. Masters are cached in darks/ keyed by camera,
+# exposure, gain and sensor readout, and only the frame area under the
+# detection window is corrected, in place.
+
+import os
+import numpy as np
+
+class DarkBuilder:
+    def __init__(self, frames=20):
+        self.frames = frames
+        self.count  = 0
+        self.total  = None
+
+    def add(self, frame):
+        if self.total is None:
+            self.total = np.zeros(frame.shape, np.float32)
+        self.total += frame
+        self.count += 1
+        return self.count >= self.frames
+
+    # master dark, with hot pixels 'sigma' MADs above the median set to 255
+    def master(self, sigma=8):
+        dark = self.total / self.count
+        # the Pi camera's XRGB8888 has a fourth padding byte, always 255
+        level = dark if dark.ndim == 2 else dark[..., :3].max(axis=2)
+        med = np.median(level)
+        mad = max(np.median(np.abs(level - med)) * 1.4826, 1.0)
+        hot = level > med + sigma * mad
+        dark = np.clip(np.rint(dark), 0, 255).astype(np.uint8)
+        if dark.ndim == 3:
+            dark[..., 3:] = 0
+            dark[hot, :3] = 255
+        else:
+            dark[hot] = 255
+        return dark, int(np.count_nonzero(hot))
+
+class Darks:
+    def __init__(self, folder='darks'):
+        self.folder = folder
+        self.key    = None
+        self.dark   = None
+
+    def path(self, key):
+        return os.path.join(self.folder, "dark_" + "_".join(str(k) for k in key) + ".npy")
+
+    # master for these camera settings, from disk if there is one
+    def select(self, key):
+        if key == self.key:
+            return self.dark is not None
+        self.key = key
+        self.dark = None
+        if os.path.exists(self.path(key)):
+            self.dark = np.load(self.path(key))
+        return self.dark is not None
+
+    def save(self, key, dark):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = self.path(key) + ".tmp.npy"
+        np.save(tmp, dark)
+        os.replace(tmp, self.path(key))
+        self.key = key
+        self.dark = dark
+
+    # subtract the master from region (x0, y0, x1, y1) of the frame, in place
+    def apply(self, frame, region):
+        if self.dark is None or self.dark.shape != frame.shape:
+            return
+        x0, y0, x1, y1 = region
+        roi = frame[y0:y1,x0:x1]
+        d = self.dark[y0:y1,x0:x1]
+        if frame.ndim == 3:
+            # colour channels only, not the padding byte
+            roi = roi[..., :3]
+            d = d[..., :3]
+        # saturating subtract, no new arrays
+        np.maximum(roi, d, out=roi)
+        np.subtract(roi, d, out=roi)
+
+# frame pixels under the detection window a,b,crop of a view made by
+# imgproc.zoom_view(frame, dim, x, y), with a pixel spare each side
+def frame_region(shape, a, b, crop, dim, x, y, height=362):
+    fx = shape[1] / dim[0]
+    fy = shape[0] / dim[1]
+    x0 = int((a - crop + x) * fx) - 1
+    x1 = int(np.ceil((a + crop + x) * fx)) + 1
+    y0 = int((height - b - crop + y) * fy) - 1
+    y1 = int(np.ceil((height - b + crop + y) * fy)) + 1
+    return max(x0, 0), max(y0, 0), min(x1, shape[1]), min(y1, shape[0])
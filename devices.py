@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# finding the USB camera and the Arduino at start up.
+# Devices are listed from sysfs in one pass, with no programs run. The camera
+# and serial port that worked last time are kept in PiAGLdevices.json and
+# tried first, so a normal boot opens them straight away; anything else is
+# only looked at if they have gone.
+
+import glob
+import json
+import os
+
+cache_file = 'PiAGLdevices.json'
+
+def load_cache(path=cache_file):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(path=cache_file, **kw):
+    cache = load_cache(path)
+    if all(cache.get(k) == v for k, v in kw.items()):
+        return
+    cache.update(kw)
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print("device cache not saved:", e)
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+# (number, name) of each V4L2 device, first node of each device first
+def video_devices(sysfs='/sys/class/video4linux'):
+    found = []
+    for path in glob.glob(os.path.join(sysfs, 'video*')):
+        n = os.path.basename(path)[5:]
+        if n.isdigit():
+            found.append((_read(os.path.join(path, 'index')) not in ('', '0'), int(n), _read(os.path.join(path, 'name'))))
+    return [(n, name) for later, n, name in sorted(found)]
+
+# a usable USB camera has user and camera controls, as v4l2-ctl showed
+def is_camera(n, opener):
+    try:
+        ctrls = opener(n)
+    except OSError:
+        return False
+    ok = 'User Controls' in ctrls.classes and 'Camera Controls' in ctrls.classes
+    ctrls.close()
+    return ok
+
+# number of the USB camera, the cached one if it is still there, or -1.
+# opener(n) returns v4l2.Controls for /dev/videoN.
+def find_camera(opener, sysfs='/sys/class/video4linux', path=cache_file):
+    devices = video_devices(sysfs)
+    cached = load_cache(path).get('camera')
+    if cached:
+        for n, name in devices:
+            if name == cached['name'] and n == cached['n'] and is_camera(n, opener):
+                return n
+    for n, name in devices:
+        if is_camera(n, opener):
+            save_cache(path, camera={'n': n, 'name': name})
+            return n
+    return -1
+
+# Arduino serial ports, stable /dev/serial/by-id names where there are any
+def serial_ports(dev='/dev'):
+    ports = [p for p in sorted(glob.glob(os.path.join(dev, 'serial', 'by-id', '*')))
+             if os.path.basename(os.path.realpath(p)).startswith('ttyACM')]
+    if not ports:
+        ports = sorted(glob.glob(os.path.join(dev, 'ttyACM*')))
+    return ports
+
+# port of the Arduino, the cached one if it is still there, or None
+def find_serial(dev='/dev', path=cache_file):
+    cached = load_cache(path).get('serial')
+    if cached and os.path.exists(cached):
+        return cached
+    ports = serial_ports(dev)
+    if not ports:
+        return None
+    save_cache(path, serial=ports[0])
+    return ports[0]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+# guiding maths without any display or camera.
+# A GuideEngine takes the detection window of each frame and returns the star
+# position, its quality and, when auto guiding, the LX200 guide commands the
+# controller (controller.py) asks for. Settings use the same names as PiAGL.py.
+
+import time
+import cv2
+import numpy as np
+from imgproc import bin_sum, noise_filter, apply_mask, circle_mask
+import centroid as cent
+import controller as ctl
+from profiler import Profiler
+
+# LX200 pulse guide commands for a correction in pixels
+def ra_cmd(xcorrect, scalex):
+    if xcorrect < 0:
+        return ":Mge" + ("0000" + str(int(abs(xcorrect) * scalex)))[-4:]
+    return ":Mgw" + ("0000" + str(int(xcorrect * scalex)))[-4:]
+
+def dec_cmd(ycorrect, scalex):
+    if ycorrect < 0:
+        return ":Mgn" + ("0000" + str(int(abs(ycorrect) * scalex)))[-4:]
+    return ":Mgs" + ("0000" + str(int(ycorrect * scalex)))[-4:]
+
+class Result:
+    def __init__(self):
+        self.acorrect  = 0      # star position from the window centre, pixels
+        self.bcorrect  = 0
+        self.quality   = 0.0    # star signal to noise ratio
+        self.flux      = 0.0    # star brightness above the sky
+        self.stars     = 0      # stars used for the position
+        self.xcorrect  = 0      # correction after RA/DEC inversion
+        self.ycorrect  = 0
+        self.ttot      = 0      # lit pixels
+        self.min_p     = 0
+        self.max_p     = 0
+        self.threshold = 0
+        self.sky       = 0      # sky level and noise of the window
+        self.noise     = 1.0
+        self.found     = False  # star passed the contrast and size checks
+        self.RAstr     = None   # this frame's correction, if over min_corr
+        self.DECstr    = None
+        self.commands  = None   # (RAstr, DECstr) to send to the mount
+        self.raw       = None   # window before thresholding
+        self.lit       = None   # thresholded window
+
+class GuideEngine:
+    settings = ('crop', 'threshold', 'binn', 'noise', 'c_mask', 'centroid', 'conl', 'min_corr',
+                'scalex', 'interval', 'InvRA', 'InvDEC', 'RAon', 'DECon', 'Auto_G', 'stars',
+                'guide_mode', 'aggression', 'hysteresis', 'ki', 'kd', 'auto_snr', 'hist_step')
+
+    def __init__(self, **kw):
+        self.crop      = 60
+        self.threshold = 0      # 0 = auto, auto_snr sky noise above the sky
+        self.auto_snr  = 5
+        self.hist_step = 1      # >1 = histogram every hist_step'th pixel and row, for big crops
+        self.binn      = 0
+        self.noise     = 0
+        self.c_mask    = 1
+        self.centroid  = cent.MEDIAN
+        self.conl      = 90
+        self.min_corr  = 100
+        self.scalex    = 66
+        self.interval  = 10
+        self.InvRA     = 1
+        self.InvDEC    = 1
+        self.RAon      = 1
+        self.DECon     = 1
+        self.Auto_G    = 0
+        self.stars     = 1      # stars to track in the window, 1 = brightest star only
+        self.guide_mode = ctl.AVERAGE
+        self.aggression = 0.7   # fraction of the offset corrected each frame
+        self.hysteresis = 0.1   # weight of the last correction, HYSTERESIS mode
+        self.ki        = 0.5    # PID integral gain per second
+        self.kd        = 0.04   # PID derivative gain, seconds
+        self.ctl       = None   # RA and DEC controllers
+        self.ctl_key   = None
+        self.refs      = None   # star positions when multi star tracking started
+        self.shift     = (0.0, 0.0)
+        self.key       = None
+        self.ar6       = None
+        self.ar7       = None
+        self.ar8       = None
+        self.prof      = Profiler()   # share one with the caller to time the stages
+        self.configure(**kw)
+
+    def configure(self, **kw):
+        for key, value in kw.items():
+            if key not in self.settings:
+                raise KeyError(key)
+            setattr(self, key, value)
+
+    # restart the controllers, eg when auto guide is switched on
+    def reset(self):
+        if self.ctl:
+            for c in self.ctl:
+                c.reset()
+
+    # new controllers when the mode or its settings change
+    def controllers(self):
+        key = (self.guide_mode, self.interval, self.aggression, self.hysteresis, self.ki, self.kd)
+        if key != self.ctl_key:
+            self.ctl_key = key
+            self.ctl = [ctl.make(self.guide_mode, interval=self.interval, aggression=self.aggression,
+                                 hysteresis=self.hysteresis, ki=self.ki, kd=self.kd) for axis in range(2)]
+
+    # time after sending r.commands from which frames can be used again.
+    # 'done' is when the mount finishes the pulses, SerialWriter.settled(),
+    # frames are compared by the time their exposure started.
+    def settle(self, r, done):
+        if self.guide_mode == ctl.AVERAGE:
+            return max(done, time.monotonic() + 0.35)
+        return done
+
+    # detection window centred on a,b of the 640x362 view, as a new grey array
+    def window(self, view, a, b):
+        crop = self.crop
+        if self.key != (a, b, crop):
+            # window moved, pick the stars up again
+            self.key = (a, b, crop)
+            self.refs = None
+        crop2 = view[(0-b)-crop:(0-b)+crop,a-crop:a+crop]
+        if crop2.ndim == 2:
+            return crop2.copy()
+        return cv2.cvtColor(crop2, cv2.COLOR_RGB2GRAY)
+
+    def buffers(self):
+        n = self.crop * 2
+        if self.ar6 is None or self.ar6.shape[0] != n:
+            self.ar6 = np.zeros((n,n), np.uint16)
+            self.ar7 = np.zeros((n,n), np.uint8)
+            self.ar8 = np.zeros((n,n), np.uint8)
+
+    # offset moves the position from the window centre to the lock point,
+    # when the window isn't centred on it
+    def process(self, gray, offset=(0, 0)):
+        r = Result()
+        prof = self.prof
+        crop = self.crop
+        self.buffers()
+        if self.c_mask == 1:
+            apply_mask(gray, crop)
+            prof.lap('mask')
+        if self.binn > 0:
+            gray = bin_sum(gray, self.binn, self.ar6)
+            prof.lap('binning')
+        r.raw = gray
+        # one histogram of the window, outside the circle left out, gives
+        # the sky, its noise, the min and max and the lit pixel count
+        mask = circle_mask(crop) if self.c_mask == 1 else None
+        step = self.hist_step
+        if step > 1:
+            hist = cv2.calcHist([gray[::step,::step]], [0], None if mask is None else mask[::step,::step],
+                                [256], [0, 256]).ravel()
+            r.min_p, r.max_p = (int(v) for v in cv2.minMaxLoc(gray, mask)[:2])
+        else:
+            hist = cv2.calcHist([gray], [0], mask, [256], [0, 256]).ravel()
+            used = np.flatnonzero(hist)
+            r.min_p = int(used[0])
+            r.max_p = int(used[-1])
+        r.sky, r.noise = cent.hist_sky(hist)
+        if self.threshold > 0:
+            r.threshold = self.threshold
+        else:
+            # half way up the star, but never into the sky noise. The third
+            # brightest pixel stands in for the peak so one hot pixel or
+            # cosmic ray can't lift it
+            peak = len(hist) - 1 - int(np.searchsorted(np.cumsum(hist[::-1]), 3))
+            r.threshold = r.sky + max(self.auto_snr * r.noise, (peak - r.sky) * .5)
+        lit = self.ar8
+        np.greater_equal(gray, r.threshold, out=lit.view(bool))
+        prof.lap('threshold')
+        if self.noise > 0:
+            lit = noise_filter(lit, self.noise, self.ar7)
+            prof.lap('NR')
+        # counted from lit itself, binning spreads the star past the circle
+        # the histogram covers
+        r.ttot = int(np.count_nonzero(lit))
+        r.lit = lit
+        if self.stars > 1:
+            r.acorrect, r.bcorrect, r.quality, r.flux, r.stars = self.multi(lit, gray, (r.sky, r.noise))
+        else:
+            r.acorrect, r.bcorrect, r.quality, r.flux = cent.locate(self.centroid, lit, gray, crop, r.ttot,
+                                                                    (r.sky, r.noise))
+            r.stars = 1
+        r.acorrect += offset[0]
+        r.bcorrect += offset[1]
+        prof.lap('centroid')
+        r.found = r.ttot > 10 and (r.max_p - r.min_p) > self.conl and r.ttot < (crop * crop) and r.stars > 0
+        r.xcorrect = r.acorrect
+        r.ycorrect = r.bcorrect
+        if self.InvRA == 1:
+            r.xcorrect = 0 - r.xcorrect
+        if self.InvDEC == 1:
+            r.ycorrect = 0 - r.ycorrect
+        limit = self.min_corr / self.scalex if self.scalex else 0
+        if r.found and self.RAon == 1 and abs(r.xcorrect) > limit:
+            r.RAstr = ra_cmd(r.xcorrect, self.scalex)
+        if r.found and self.DECon == 1 and abs(r.ycorrect) > limit:
+            r.DECstr = dec_cmd(r.ycorrect, self.scalex)
+        if self.Auto_G == 1:
+            self.controllers()
+            # averaging takes every frame like it always has, the others
+            # only frames with the star
+            xc = yc = None
+            if r.found or self.guide_mode == ctl.AVERAGE:
+                xc = self.ctl[0].update(r.xcorrect)
+                yc = self.ctl[1].update(r.ycorrect)
+            RAstr  = ":Mge0000"
+            DECstr = ":Mgn0000"
+            if xc is not None and r.found and self.RAon == 1 and abs(xc) > limit:
+                RAstr = ra_cmd(xc, self.scalex)
+            if yc is not None and r.found and self.DECon == 1 and abs(yc) > limit:
+                DECstr = dec_cmd(yc, self.scalex)
+            if RAstr != ":Mge0000" or DECstr != ":Mgn0000":
+                r.commands = (RAstr, DECstr)
+        prof.lap('control')
+        return r
+
+    # position of the brightest star from the movement of up to 'stars' stars.
+    # Each star found is matched to where it was when tracking started, and
+    # the shifts are averaged weighted by SNR squared, so the noise falls
+    # roughly as 1/sqrt(stars).
+    def multi(self, lit, raw, noise=None):
+        crop = self.crop
+        found = cent.detect(lit, raw, self.stars, noise=noise)
+        if len(found) == 0:
+            return 0.0, 0.0, 0.0, 0.0, 0
+        if self.refs is None:
+            self.refs = found[:,:2].copy()
+            self.shift = (0.0, 0.0)
+        radius = max(3.0, crop / 4)
+        dx = dy = wsum = 0.0
+        snr2 = flux = 0.0
+        used = 0
+        for ref in self.refs:
+            px = ref[0] + self.shift[0]
+            py = ref[1] + self.shift[1]
+            d2 = (found[:,0] - px)**2 + (found[:,1] - py)**2
+            i = int(np.argmin(d2))
+            if d2[i] > radius * radius:
+                continue
+            w = found[i,2] ** 2
+            dx += w * (found[i,0] - ref[0])
+            dy += w * (found[i,1] - ref[1])
+            wsum += w
+            snr2 += w
+            flux += found[i,3]
+            used += 1
+        if used == 0 or wsum <= 0:
+            # lost them all, start again from the stars found next frame
+            self.refs = None
+            return 0.0, 0.0, 0.0, 0.0, 0
+        self.shift = (dx / wsum, dy / wsum)
+        return (self.refs[0][0] + self.shift[0] - crop, self.refs[0][1] + self.shift[1] - crop,
+                float(np.sqrt(snr2)), flux, used)
+
+# a,b of the brightest star in a 640x362 view, at least crop from the edges
+def pick_star(view, crop):
+    if view.ndim == 3:
+        view = cv2.cvtColor(view, cv2.COLOR_RGB2GRAY)
+    blur = cv2.GaussianBlur(view, (5, 5), 0)
+    h, w = blur.shape
+    inner = blur[crop+1:h-crop-1, crop+1:w-crop-1]
+    row, col = np.unravel_index(np.argmax(inner), inner.shape)
+    return int(col) + crop + 1, h - (int(row) + crop + 1)
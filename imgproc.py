@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# whole-array image operations used by the detection window in PiAGL.py
+
+import cv2
+import numpy as np
+
+# binning, sums each (binn+1) x (binn+1) block ending at a pixel, clipped to 255.
+# Uses an integral image so the cost is one cv2 call whatever the crop size.
+# Only the inner pixels of out are written, as the original per-pixel loop did.
+def bin_sum(gray, binn, out):
+    n = gray.shape[0]
+    k = binn + 1
+    s = cv2.integral(gray)
+    out[binn:n-binn,binn:n-binn] = np.minimum(s[k:n-binn+1,k:n-binn+1] - s[0:n-2*binn,k:n-binn+1]
+                                            - s[k:n-binn+1,0:n-2*binn] + s[0:n-2*binn,0:n-2*binn], 255)
+    return out
+
+# noise reduction, a pixel stays lit only if the whole noise x noise block
+# above and left of it is lit, ie a windowed count on the binary image.
+# Edge pixels the window can't reach are cleared.
+def noise_filter(gray, noise, out):
+    n = gray.shape[0]
+    s = cv2.integral(gray)
+    count = s[noise:n-noise,noise:n-noise] - s[0:n-2*noise,noise:n-noise] - s[noise:n-noise,0:n-2*noise] + s[0:n-2*noise,0:n-2*noise]
+    out[:] = 0
+    out[noise:n-noise,noise:n-noise] = count >= noise * noise
+    return out
+
+# circular window masks, built once per crop size
+masks = {}
+
+def circle_mask(crop):
+    m = masks.get(crop)
+    if m is None:
+        r = np.arange(crop*2) + 0.5 - crop
+        m = ((r[:,None]**2 + r[None,:]**2) <= crop*crop).astype(np.uint8)
+        masks[crop] = m
+    return m
+
+# blank the corners outside the circular window, in place
+def apply_mask(gray, crop):
+    np.multiply(gray, circle_mask(crop), out=gray)
+    return gray
+
+# the 640x362 display view at x,y of the frame resized to dim, computed
+# straight from the frame so only the pixels shown are ever resampled.
+# Upscaling, or downscaling by less than 2, maps each view pixel back into the
+# frame with one warpAffine. Bigger reductions resize just the frame region
+# under the view with INTER_AREA.
+def zoom_view(image, dim, x, y, size=(640, 362)):
+    if tuple(dim) == tuple(size):
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    sh, sw = image.shape[:2]
+    fx = sw / dim[0]
+    fy = sh / dim[1]
+    if fx < 2 and fy < 2:
+        M = np.float32([[fx, 0, fx * (x + 0.5) - 0.5], [0, fy, fy * (y + 0.5) - 0.5]])
+        return cv2.warpAffine(image, M, size, flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_REPLICATE)
+    x0 = int(x * fx)
+    y0 = int(y * fy)
+    x1 = min(int(np.ceil((x + size[0]) * fx)), sw)
+    y1 = min(int(np.ceil((y + size[1]) * fy)), sh)
+    return cv2.resize(image[y0:y1,x0:x1], size, interpolation=cv2.INTER_AREA)
+
+if __name__ == '__main__':
+    # per frame cost of binning and noise reduction at each crop size
+    import time
+    loops = 200
+    rng = np.random.default_rng(0)
+    print("crop   bin 2x2   NR 1     NR 2     NR 3   (mS per frame)")
+    for crop in (10, 20, 40, 60, 90, 120, 150, 180):
+        gray = rng.integers(0, 256, (crop*2, crop*2)).astype(np.uint8)
+        lit = (gray > 128).astype(np.uint8)
+        ar6 = np.zeros((crop*2, crop*2), np.uint16)
+        line = "%4d" % crop
+        for binn, noise in ((1, 0), (0, 1), (0, 2), (0, 3)):
+            start = time.perf_counter()
+            for l in range(loops):
+                if binn > 0:
+                    bin_sum(gray, binn, ar6)
+                else:
+                    noise_filter(lit, noise, ar6)
+            line += "  %7.3f" % ((time.perf_counter() - start) * 1000 / loops)
+        print(line)
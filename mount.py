@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# LX200 serial output in a background thread.
+# The writer owns the serial port. Commands are queued without blocking and
+# written in order, with a gap between writes so the Arduino can keep up.
+# A guide pulse still waiting to go out is replaced by a newer pulse for the
+# same axis, so a slow port never sends stale corrections.
+# Opening the port resets the Arduino, so nothing is written until it has
+# booted: it sends something, or 'boot' seconds have passed. Start up doesn't
+# wait for this, only the first write does.
+# settled() says when the mount will have finished every pulse written or
+# queued so far, counting the gaps between writes, so the guider knows which
+# frames were taken with the mount still moving.
+
+import threading
+import time
+from collections import deque
+
+# axis a :Mg guide command moves, None for anything else
+def axis(cmd):
+    i = cmd.find(":Mg")
+    if i < 0 or len(cmd) < i + 4:
+        return None
+    if cmd[i+3] in "ew":
+        return "RA"
+    if cmd[i+3] in "ns":
+        return "DEC"
+    return None
+
+# seconds a guide command moves the mount for, 0 for anything else
+def pulse(cmd):
+    if axis(cmd) is None:
+        return 0.0
+    try:
+        return int(cmd[-4:]) / 1000
+    except ValueError:
+        return 0.0
+
+class SerialWriter(threading.Thread):
+    def __init__(self, ser, spacing=0.1, boot=0.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.ser      = ser
+        self.spacing  = spacing
+        self.boot     = time.monotonic() + boot
+        self.ready    = threading.Event()
+        self.pending  = deque()
+        self.current  = None   # command taken off the queue, not yet written
+        self.next_write = 0.0
+        self.busy_until = 0.0  # end of the last pulse written
+        self.cond     = threading.Condition()
+        self.running  = True
+        self.sent     = 0
+        self.replaced = 0
+        self.latency  = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    # queue a command, gap is the minimum time before the next write
+    def send(self, cmd, gap=None, key=None):
+        if gap is None:
+            gap = self.spacing
+        with self.cond:
+            if key is not None:
+                for item in self.pending:
+                    if item[0] == key:
+                        item[1] = cmd
+                        item[2] = gap
+                        item[3] = time.monotonic()
+                        self.replaced += 1
+                        return
+            self.pending.append([key, cmd, gap, time.monotonic()])
+            self.cond.notify()
+
+    # queue a guide pulse, replacing any pulse for the same axis not yet sent
+    def guide(self, cmd, gap=None):
+        self.send(cmd, gap, axis(cmd))
+
+    def wait_boot(self):
+        while self.running and time.monotonic() < self.boot:
+            try:
+                if self.ser.in_waiting:
+                    break
+            except (AttributeError, OSError):
+                break
+            time.sleep(0.02)
+        self.ready.set()
+
+    def run(self):
+        self.wait_boot()
+        while self.running:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or not self.running)
+                if not self.running:
+                    break
+                self.current = self.pending.popleft()
+                key, cmd, gap, queued = self.current
+            wait = self.next_write - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.ser.write(bytes(cmd.encode('ascii')))
+            except Exception as e:
+                print("serial write failed:", e)
+            now = time.monotonic()
+            with self.cond:
+                self.current = None
+                self.next_write = now + gap
+                self.busy_until = max(self.busy_until, now + pulse(cmd))
+            self.latency = now - queued
+            self.max_latency = max(self.max_latency, self.latency)
+            self.total_latency += self.latency
+            self.sent += 1
+
+    # time the mount will have finished the pulses written and queued now
+    def settled(self):
+        with self.cond:
+            items = list(self.pending)
+            if self.current:
+                items.insert(0, self.current)
+            t = max(self.next_write, time.monotonic())
+            if not self.ready.is_set():
+                t = max(t, self.boot)
+            end = self.busy_until
+            for key, cmd, gap, queued in items:
+                end = max(end, t + pulse(cmd))
+                t += gap
+        return end
+
+    def stats(self):
+        with self.cond:
+            depth = len(self.pending)
+        mean = self.total_latency / self.sent if self.sent else 0.0
+        return {'depth': depth, 'sent': self.sent, 'replaced': self.replaced,
+                'latency': self.latency, 'mean_latency': mean, 'max_latency': self.max_latency}
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
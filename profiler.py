@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# per stage timing of the guiding loop.
+# start() at the top of a frame, then lap('stage') after each stage records
+# the time since the previous mark. The last 'size' samples of each stage are
+# kept in a ring buffer, so memory stays fixed however long it runs.
+# When not enabled start() and lap() return straight away.
+
+import csv
+import json
+import time
+import numpy as np
+
+class Profiler:
+    def __init__(self, size=256, enabled=False):
+        self.size    = size
+        self.enabled = enabled
+        self.samples = {}
+        self.counts  = {}
+        self.last    = 0.0
+        self.first   = 0.0
+
+    def start(self):
+        if self.enabled:
+            self.last = self.first = time.perf_counter()
+
+    def lap(self, stage):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.add(stage, now - self.last)
+        self.last = now
+
+    # time from start() to now, as one more stage
+    def total(self, stage='total'):
+        if self.enabled:
+            self.add(stage, time.perf_counter() - self.first)
+
+    def add(self, stage, seconds):
+        buf = self.samples.get(stage)
+        if buf is None:
+            buf = self.samples[stage] = np.zeros(self.size)
+            self.counts[stage] = 0
+        buf[self.counts[stage] % self.size] = seconds
+        self.counts[stage] += 1
+
+    def reset(self):
+        self.samples = {}
+        self.counts  = {}
+
+    # recent samples of a stage in mS, oldest first
+    def history(self, stage):
+        n = self.counts[stage]
+        buf = self.samples[stage] * 1000
+        if n <= self.size:
+            return buf[:n]
+        i = n % self.size
+        return np.concatenate((buf[i:], buf[:i]))
+
+    # {stage: (p50, p95, p99, mean)} in mS
+    def stats(self):
+        out = {}
+        for stage in self.samples:
+            h = self.history(stage)
+            if len(h):
+                p = np.percentile(h, (50, 95, 99))
+                out[stage] = (p[0], p[1], p[2], h.mean())
+        return out
+
+    def export(self, base):
+        stats = self.stats()
+        with open(base + '.csv', 'w', newline='') as f:
+            out = csv.writer(f)
+            out.writerow(['stage', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'frames'])
+            for stage, s in stats.items():
+                out.writerow([stage] + ["%.3f" % v for v in s] + [self.counts[stage]])
+        with open(base + '.json', 'w') as f:
+            json.dump({stage: {'p50_ms': s[0], 'p95_ms': s[1], 'p99_ms': s[2], 'mean_ms': s[3],
+                               'frames': self.counts[stage], 'samples_ms': self.history(stage).round(3).tolist()}
+                       for stage, s in stats.items()}, f, indent=1)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# stand-ins for the camera and the Arduino, so the pipeline can be run
+# and measured away from the telescope.
+# ReplayCamera plays back frames from a directory of images, a .npy stack
+# (frames, height, width[, 3]) or a video file, with grab() like the camera
+# grab functions given to capture.FrameGrabber. Colour frames are RGB.
+# RecordingSerial and FakeArduino record the LX200 stream written to them,
+# FakeV4L2 answers USB camera control ioctls.
+
+import errno
+import os
+import tty
+import threading
+import time
+import cv2
+import numpy as np
+
+image_types = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.pgm', '.ppm')
+
+class ReplayCamera:
+    def __init__(self, source, gray=False, loop=True, fps=0):
+        self.source = source
+        self.gray   = gray
+        self.loop   = loop
+        self.fps    = fps
+        self.index  = 0
+        self.last   = 0
+        self.video  = None
+        self.files  = None
+        self.stack  = None
+        if os.path.isdir(source):
+            self.files = sorted(os.path.join(source, f) for f in os.listdir(source)
+                                if f.lower().endswith(image_types))
+            self.count = len(self.files)
+        elif source.endswith('.npy'):
+            self.stack = np.load(source, mmap_mode='r')
+            self.count = len(self.stack)
+        else:
+            self.video = cv2.VideoCapture(source)
+            self.count = int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.count <= 0 and self.video is None:
+            raise ValueError("no frames in " + source)
+
+    def __len__(self):
+        return self.count
+
+    def read(self, i):
+        if self.files is not None:
+            if self.gray:
+                return cv2.imread(self.files[i], cv2.IMREAD_GRAYSCALE)
+            return cv2.cvtColor(cv2.imread(self.files[i]), cv2.COLOR_BGR2RGB)
+        if self.stack is not None:
+            frame = np.asarray(self.stack[i])
+            if self.gray and frame.ndim == 3:
+                return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+            return frame
+        if i == 0:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        ok, frame = self.video.read()
+        if not ok:
+            return None
+        if self.gray:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    # next frame, None at the end unless looping
+    def grab(self):
+        if self.index >= self.count and self.video is None:
+            if not self.loop:
+                return None
+            self.index = 0
+        frame = self.read(self.index)
+        if frame is None:
+            if not self.loop or self.index == 0:
+                return None
+            self.index = 0
+            frame = self.read(0)
+        self.index += 1
+        if self.fps > 0:
+            # pace playback like a camera running at fps
+            wait = self.last + 1 / self.fps - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.last = time.monotonic()
+        return frame
+
+    def frames(self):
+        self.index = 0
+        for i in range(self.count):
+            frame = self.grab()
+            if frame is None:
+                break
+            yield frame
+
+# serial port that keeps what is written, and optionally logs it to a file
+class RecordingSerial:
+    def __init__(self, path=None):
+        self.log = []
+        self.file = open(path, 'a') if path else None
+
+    def write(self, data):
+        t = time.monotonic()
+        self.log.append((t, data))
+        if self.file:
+            self.file.write("%.3f %s\n" % (t, data.decode('ascii', 'replace')))
+            self.file.flush()
+        return len(data)
+
+    def commands(self):
+        return [data.decode('ascii', 'replace') for t, data in self.log]
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+# pseudo terminal standing in for the Arduino, open .port with serial.Serial
+class FakeArduino(threading.Thread):
+    def __init__(self, path=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        self.recorder = RecordingSerial(path)
+
+    def run(self):
+        while True:
+            try:
+                data = os.read(self.master, 256)
+            except OSError:
+                break
+            if not data:
+                break
+            # LX200 commands start with ':' or '#:', each arrives in one write
+            for part in data.replace(b"#", b"").split(b":"):
+                if part:
+                    self.recorder.write(b":" + part)
+
+    def commands(self):
+        return self.recorder.commands()
+
+# USB camera controls for v4l2.Controls(None, ioctl=FakeV4L2(...)), from
+# (label, min, max, step, default[, type, flags]) rows. Keeps the values set
+# and the ioctls made.
+class FakeV4L2:
+    def __init__(self, controls, classes=("User Controls", "Camera Controls")):
+        import v4l2
+        self.v4l2 = v4l2
+        self.ctrls = []
+        for i, name in enumerate(classes):
+            self.ctrls.append((0x00980001 + i * 0x10000, name, v4l2.V4L2_CTRL_TYPE_CTRL_CLASS, 0, 0, 0, 0, 0))
+        for i, c in enumerate(controls):
+            kind = c[5] if len(c) > 5 else v4l2.V4L2_CTRL_TYPE_INTEGER
+            flags = c[6] if len(c) > 6 else 0
+            self.ctrls.append((0x00980900 + i, c[0], kind) + tuple(c[1:5]) + (flags,))
+        self.ctrls.sort()
+        self.values = {c[0]: c[6] for c in self.ctrls}
+        self.errors = {}
+        self.calls = []
+
+    def __call__(self, fd, request, arg):
+        v = self.v4l2
+        self.calls.append(request)
+        if request == v.VIDIOC_QUERYCTRL:
+            want = arg.id & ~v.V4L2_CTRL_FLAG_NEXT_CTRL
+            nxt = arg.id & v.V4L2_CTRL_FLAG_NEXT_CTRL
+            for c in self.ctrls:
+                if (nxt and c[0] > want) or (not nxt and c[0] == want):
+                    arg.id, arg.name, arg.type, arg.minimum, arg.maximum, arg.step, arg.default_value = \
+                        c[0], c[1].encode(), c[2], c[3], c[4], c[5], c[6]
+                    arg.flags = c[7]
+                    return 0
+            raise OSError(errno.EINVAL, "no more controls")
+        if request == v.VIDIOC_G_CTRL:
+            self.check(arg.id, request)
+            arg.value = self.values[arg.id]
+        elif request == v.VIDIOC_S_CTRL:
+            self.check(arg.id, request)
+            self.values[arg.id] = arg.value
+        elif request == v.VIDIOC_S_EXT_CTRLS:
+            # all or nothing, like the kernel
+            for i in range(arg.count):
+                self.check(arg.controls[i].id, v.VIDIOC_S_CTRL)
+            for i in range(arg.count):
+                self.values[arg.controls[i].id] = arg.controls[i].u.value
+        else:
+            raise OSError(errno.ENOTTY, "not supported")
+        return 0
+
+    # make G_CTRL or S_CTRL (and S_EXT_CTRLS) of a control fail with errno
+    def fail(self, label, request, err):
+        self.errors[(self.id(label), request)] = err
+
+    def check(self, cid, request):
+        err = self.errors.get((cid, request))
+        if err:
+            raise OSError(err, os.strerror(err))
+
+    def id(self, label):
+        for c in self.ctrls:
+            if c[1] == label:
+                return c[0]
+        raise KeyError(label)
+
+    def value(self, label):
+        return self.values[self.id(label)]
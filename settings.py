@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# saved settings, PiAGLsettings.json.
+# Values are kept by name with a schema version, and limited to a range,
+# narrowed to what the camera can do once it is open. update() only notes
+# what changed; a background thread writes the file once nothing has changed
+# for 'delay' seconds, to a temporary file renamed over the old one, so the
+# guiding loop never waits on the SD card and a power cut can't leave half a
+# file. The old positional PiAGLconfig.txt is read once if there is no
+# settings file yet.
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+version = 1
+
+# name: (default, min, max)
+schema = OrderedDict([
+    ('crop',         (60, 10, 180)),
+    ('threshold',    (0, 0, 255)),
+    ('scale',        (100, 0, 2000)),
+    ('fps',          (25, 1, 40)),
+    ('mode',         (0, 0, 3)),
+    ('speed',        (80000, 1000, 6000000)),
+    ('Again',        (0, 0, 64)),
+    ('brightness',   (3, -255, 255)),
+    ('contrast',     (20, -255, 255)),
+    ('Auto_G',       (0, 0, 1)),
+    ('min_corr',     (100, 0, 1000)),
+    ('interval',     (10, 1, 100)),
+    ('InvRA',        (1, 0, 1)),
+    ('InvDEC',       (1, 0, 1)),
+    ('preview',      (0, 0, 1)),
+    ('c_mask',       (1, 0, 1)),
+    ('fullscreen',   (1, 0, 1)),
+    ('ev',           (0, -12, 12)),
+    ('noise',        (0, 0, 3)),
+    ('binn',         (0, 0, 3)),
+    ('Auto_Gain',    (1, 0, 3)),
+    ('exposure',     (255, 1, 100000)),
+    ('gain',         (35, 0, 1000)),
+    ('gamma',        (31, 0, 1000)),
+    ('red_balance',  (66, 0, 1000)),
+    ('blue_balance', (48, 0, 1000)),
+    ('auto_contour', (0, 0, 1)),
+    ('contour',      (0, 0, 63)),
+    ('dnr',          (0, 0, 3)),
+    ('backlight',    (0, 0, 2)),
+    ('conl',         (90, 1, 255)),
+    ('guide_mode',   (0, 0, 3)),
+])
+
+# line order of the old PiAGLconfig.txt
+legacy = list(schema)[:31]
+
+class Settings(threading.Thread):
+    def __init__(self, path='PiAGLsettings.json', legacy_path='PiAGLconfig.txt', delay=2.0, defaults=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.path        = path
+        self.legacy_path = legacy_path
+        self.delay       = delay
+        self.limits      = {name: (lo, hi) for name, (d, lo, hi) in schema.items()}
+        self.values      = OrderedDict((name, d) for name, (d, lo, hi) in schema.items())
+        if defaults:
+            self.values.update((k, v) for k, v in defaults.items() if k in schema)
+        self.changed     = None   # time of the first unsaved change
+        self.last        = 0.0    # time of the latest change
+        self.cond        = threading.Condition()
+        self.io          = threading.Lock()   # one write of the file at a time
+        self.running     = True
+        self.writes      = 0
+        self.load()
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def load(self):
+        data = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print("settings not read, using defaults:", e)
+        elif os.path.exists(self.legacy_path):
+            with open(self.legacy_path) as f:
+                lines = [line.strip() for line in f if line.strip()]
+            data = {'version': 0, 'settings': {}}
+            for name, line in zip(legacy, lines):
+                try:
+                    data['settings'][name] = int(line)
+                except ValueError:
+                    print("old config", name, "not a number, default used:", line)
+            # save them under the new name
+            self.changed = self.last = time.monotonic()
+        if data is None:
+            return
+        if data.get('version', 0) > version:
+            print("settings file is from a newer version, unknown settings ignored")
+        for name, value in data.get('settings', {}).items():
+            if name in schema:
+                self.values[name] = self.check(name, value)
+
+    def check(self, name, value):
+        lo, hi = self.limits[name]
+        if not isinstance(value, (int, float)):
+            return schema[name][0]
+        return type(schema[name][0])(min(max(value, lo), hi))
+
+    # narrow a setting to the camera's range, returns its value within it
+    def limit(self, name, lo, hi):
+        d, slo, shi = schema[name]
+        self.limits[name] = (max(lo, slo), min(hi, shi))
+        value = self.check(name, self.values[name])
+        if value != self.values[name]:
+            self.update(**{name: value})
+        return value
+
+    def update(self, **kw):
+        with self.cond:
+            for name, value in kw.items():
+                value = self.check(name, value)
+                if self.values[name] != value:
+                    self.values[name] = value
+                    self.last = time.monotonic()
+                    if self.changed is None:
+                        self.changed = self.last
+            if self.changed is not None:
+                self.cond.notify()
+
+    def write(self):
+        # stop() and the thread can both get here, they share the .tmp file
+        with self.io:
+            with self.cond:
+                data = {'version': version, 'settings': dict(self.values)}
+                self.changed = None
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.writes += 1
+
+    def run(self):
+        while self.running:
+            with self.cond:
+                self.cond.wait_for(lambda: self.changed is not None or not self.running)
+                # wait for the clicks to stop
+                wait = self.last + self.delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                self.write()
+            except OSError as e:
+                print("settings not saved:", e)
+                time.sleep(self.delay)
+
+    # write anything unsaved now, eg on exit
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.changed is not None:
+            self.write()
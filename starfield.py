@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# synthetic star fields with known star positions, for testing guiding accuracy
+# and speed together.
+#   python3 starfield.py field.npy --frames 200 --fwhm 3 --drift 0.05,0 --pe 4,120
+# writes the frames as a .npy stack, or as numbered PNGs if the output is a
+# directory, plus out.truth.csv with the guide star position in each frame.
+# Positions are in frame pixels, pixel i covering i to i+1. The guide star is
+# the first star, at the centre of the frame unless moved with --star.
+
+import argparse
+import os
+import cv2
+import numpy as np
+
+class StarField:
+    def __init__(self, width=640, height=480, stars=5, fwhm=3.0, moffat=0.0, seeing=0.3,
+                 sky=20.0, read_noise=3.0, gain=1.0, hot_pixels=20, flux=4000.0,
+                 drift=(0.0, 0.0), pe=(0.0, 0.0), seed=0, star=None):
+        self.width      = width
+        self.height     = height
+        self.fwhm       = fwhm        # star size in pixels
+        self.moffat     = moffat      # 0 = gaussian PSF, else moffat beta
+        self.seeing     = seeing      # rms random star motion each frame, pixels
+        self.sky        = sky         # sky background, ADU
+        self.read_noise = read_noise  # ADU rms
+        self.gain       = gain        # electrons per ADU for shot noise, 0 = no shot noise
+        self.drift      = drift       # x,y drift per frame, pixels
+        self.pe         = pe          # periodic error in x, amplitude pixels, period frames
+        self.rng        = np.random.default_rng(seed)
+        if star is None:
+            star = (width / 2, height / 2)
+        # guide star first, then random field stars
+        self.stars = [(star[0], star[1], flux)]
+        for s in range(stars - 1):
+            self.stars.append((self.rng.uniform(20, width - 20), self.rng.uniform(20, height - 20),
+                               flux * self.rng.uniform(0.05, 1.0)))
+        self.hot = (self.rng.integers(0, height, hot_pixels), self.rng.integers(0, width, hot_pixels),
+                    self.rng.uniform(100, 255, hot_pixels))
+
+    # offset of the whole field in frame n, drift plus periodic error
+    def track(self, n):
+        dx = self.drift[0] * n
+        dy = self.drift[1] * n
+        if self.pe[1] > 0:
+            dx += self.pe[0] * np.sin(2 * np.pi * n / self.pe[1])
+        return dx, dy
+
+    def psf(self, x, y, flux, fwhm, img):
+        r = int(3 * fwhm) + 2
+        x0 = max(int(x) - r, 0)
+        x1 = min(int(x) + r + 1, self.width)
+        y0 = max(int(y) - r, 0)
+        y1 = min(int(y) + r + 1, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        dx = np.arange(x0, x1) + 0.5 - x
+        dy = np.arange(y0, y1) + 0.5 - y
+        r2 = dy[:,None]**2 + dx[None,:]**2
+        if self.moffat > 0:
+            alpha = fwhm / (2 * np.sqrt(2 ** (1 / self.moffat) - 1))
+            p = (1 + r2 / alpha**2) ** -self.moffat
+        else:
+            s = fwhm / 2.3548
+            p = np.exp(-r2 / (2 * s * s))
+        img[y0:y1,x0:x1] += flux * p / p.sum()
+
+    # frame n as uint8, and the guide star position
+    def frame(self, n):
+        img = np.full((self.height, self.width), self.sky, np.float64)
+        dx, dy = self.track(n)
+        jx, jy = self.rng.normal(0, self.seeing, 2)
+        fwhm = self.fwhm * self.rng.uniform(0.9, 1.1)
+        for i, (x, y, flux) in enumerate(self.stars):
+            self.psf(x + dx + jx, y + dy + jy, flux, fwhm, img)
+        if self.gain > 0:
+            img = self.rng.poisson(img * self.gain) / self.gain
+        img += self.rng.normal(0, self.read_noise, img.shape)
+        img[self.hot[0], self.hot[1]] = self.hot[2]
+        x, y = self.stars[0][:2]
+        return np.clip(img, 0, 255).astype(np.uint8), (x + dx + jx, y + dy + jy)
+
+def truth_path(out):
+    return out.rstrip('/') + '.truth.csv'
+
+def load_truth(out):
+    path = truth_path(out)
+    if not os.path.exists(path):
+        return None
+    return np.loadtxt(path, delimiter=',', skiprows=1)[:,1:3]
+
+def write(field, out, frames, rgb=False):
+    pos = []
+    stack = []
+    if not out.endswith('.npy'):
+        os.makedirs(out, exist_ok=True)
+    for n in range(frames):
+        img, p = field.frame(n)
+        pos.append(p)
+        if rgb:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+        if out.endswith('.npy'):
+            stack.append(img)
+        else:
+            cv2.imwrite(os.path.join(out, "frame%05d.png" % n), img)
+    if out.endswith('.npy'):
+        np.save(out, np.array(stack))
+    with open(truth_path(out), 'w') as f:
+        f.write("frame,x,y\n")
+        for n, p in enumerate(pos):
+            f.write("%d,%.4f,%.4f\n" % (n, p[0], p[1]))
+    return pos
+
+def pair(text):
+    return tuple(float(v) for v in text.split(','))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="synthetic star field frames")
+    parser.add_argument("out", help="output .npy file or directory for PNGs")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--size", type=pair, default=(640, 480))
+    parser.add_argument("--stars", type=int, default=5)
+    parser.add_argument("--star", type=pair, default=None, help="guide star x,y")
+    parser.add_argument("--flux", type=float, default=4000)
+    parser.add_argument("--fwhm", type=float, default=3.0)
+    parser.add_argument("--moffat", type=float, default=0, help="moffat beta, 0 = gaussian")
+    parser.add_argument("--seeing", type=float, default=0.3)
+    parser.add_argument("--sky", type=float, default=20)
+    parser.add_argument("--read-noise", type=float, default=3)
+    parser.add_argument("--gain", type=float, default=1)
+    parser.add_argument("--hot", type=int, default=20)
+    parser.add_argument("--drift", type=pair, default=(0, 0), help="x,y pixels per frame")
+    parser.add_argument("--pe", type=pair, default=(0, 0), help="amplitude pixels,period frames")
+    parser.add_argument("--rgb", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    field = StarField(int(args.size[0]), int(args.size[1]), args.stars, args.fwhm, args.moffat, args.seeing,
+                      args.sky, args.read_noise, args.gain, args.hot, args.flux, args.drift, args.pe,
+                      args.seed, args.star)
+    write(field, args.out, args.frames, args.rgb)
+    print("wrote", args.frames, "frames to", args.out)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# guide log, one row per frame.
+# Rows go into a preallocated ring buffer, so recording costs a few array
+# stores and memory stays fixed all night. A background thread appends new
+# rows to a CSV file every second and starts a new file when it passes
+# max_bytes, keeping the last 'keep' files (PiAGLlog.csv, PiAGLlog.1.csv ..).
+# If the writer falls a whole buffer behind the oldest rows are dropped.
+
+import os
+import threading
+import time
+import numpy as np
+
+fields = [('t', 'f8'),          # frame time, seconds
+          ('x', 'f4'),          # star position from the lock point, pixels
+          ('y', 'f4'),
+          ('flux', 'f4'),       # star brightness above the sky
+          ('snr', 'f4'),
+          ('threshold', 'f4'),
+          ('found', 'u1'),      # star passed the detection checks
+          ('ra_ms', 'i2'),      # guide pulse sent, + = west
+          ('dec_ms', 'i2'),     # + = south
+          ('latency', 'f4')]    # exposure start to end of processing, seconds
+
+formats = ['%.3f', '%.3f', '%.3f', '%.0f', '%.1f', '%.1f', '%d', '%d', '%d', '%.4f']
+
+# signed pulse length in mS of an LX200 guide command
+def pulse_ms(cmd):
+    if not cmd or len(cmd) < 8:
+        return 0
+    ms = int(cmd[-4:])
+    if cmd[-5] in "en":
+        return -ms
+    return ms
+
+class Telemetry(threading.Thread):
+    def __init__(self, path='PiAGLlog.csv', size=4096, max_bytes=10000000, keep=5, period=1.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.path      = path
+        self.rows      = np.zeros(size, dtype=fields)
+        self.size      = size
+        self.max_bytes = max_bytes
+        self.keep      = keep
+        self.period    = period
+        self.head      = 0     # rows recorded
+        self.tail      = 0     # rows written
+        self.dropped   = 0
+        self.lock      = threading.Lock()
+        self.running   = True
+
+    def record(self, t, x, y, flux, snr, threshold, found, ra_ms, dec_ms, latency):
+        with self.lock:
+            self.rows[self.head % self.size] = (t, x, y, flux, snr, threshold, found, ra_ms, dec_ms, latency)
+            self.head += 1
+
+    def pending(self):
+        with self.lock:
+            if self.head - self.tail > self.size:
+                self.dropped += self.head - self.tail - self.size
+                self.tail = self.head - self.size
+            start = self.tail % self.size
+            n = self.head - self.tail
+            if start + n <= self.size:
+                out = self.rows[start:start+n].copy()
+            else:
+                out = np.concatenate((self.rows[start:], self.rows[:start+n-self.size]))
+            self.tail = self.head
+        return out
+
+    def rotate(self):
+        for i in range(self.keep - 1, 0, -1):
+            old = self.name(i - 1)
+            if os.path.exists(old):
+                os.replace(old, self.name(i))
+
+    def name(self, i):
+        if i == 0:
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return "%s.%d%s" % (base, i, ext)
+
+    def flush(self):
+        rows = self.pending()
+        if len(rows) == 0:
+            return
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            self.rotate()
+        new = not os.path.exists(self.path)
+        with open(self.path, 'a') as f:
+            if new:
+                f.write(",".join(name for name, kind in fields) + "\n")
+            np.savetxt(f, rows, fmt=formats, delimiter=',')
+
+    def run(self):
+        while self.running:
+            time.sleep(self.period)
+            try:
+                self.flush()
+            except OSError as e:
+                print("telemetry write failed:", e)
+
+    def stop(self):
+        self.running = False
+        self.flush()
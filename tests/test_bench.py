@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import starfield
+
+bench = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench.py")
+
+def run(path, *args):
+    return subprocess.run([sys.executable, bench, path, "--crop", "30", "--centroid", "3"] + list(args),
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+def test_bench_thresholds(tmp_path):
+    path = str(tmp_path / "field.npy")
+    starfield.write(starfield.StarField(fwhm=4, drift=(0.05, 0.02), seed=2), path, 20)
+    out = run(path, "--max-error", "0.5", "--max-bias", "0.5", "--min-fps", "5")
+    assert out.returncode == 0, out.stdout
+    assert "error rms" in out.stdout
+    # too slow
+    out = run(path, "--min-fps", "1000000")
+    assert out.returncode == 1 and "FAILED" in out.stdout
+    # too much scatter
+    out = run(path, "--max-error", "0.0001")
+    assert out.returncode == 1
+
+# a constant offset leaves the rms alone but fails --max-bias
+def test_bench_bias(tmp_path):
+    path = str(tmp_path / "field.npy")
+    starfield.write(starfield.StarField(fwhm=4, seed=2), path, 20)
+    truth = starfield.truth_path(path)
+    rows = np.loadtxt(truth, delimiter=',', skiprows=1)
+    rows[:,1] += 2.0
+    np.savetxt(truth, rows, fmt=['%d', '%.4f', '%.4f'], delimiter=',', header="frame,x,y", comments='')
+    assert run(path, "--max-error", "0.5").returncode == 0
+    assert run(path, "--max-error", "0.5", "--max-bias", "0.5").returncode == 1
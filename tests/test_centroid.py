@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import centroid as cent
+from starfield import StarField
+
+crop = 15
+
+# a window with one star at a known sub-pixel position, no shot noise
+def window(x, y, flux=4000.0, seed=0):
+    field = StarField(width=crop*2, height=crop*2, stars=1, seeing=0, hot_pixels=0, sky=20, read_noise=3,
+                      gain=0, flux=flux, fwhm=3, star=(x, y), seed=seed)
+    raw, (tx, ty) = field.frame(0)
+    bg, sigma = cent.sky(raw)
+    lit = (raw >= bg + 5 * sigma).astype(np.uint8)
+    return lit, raw, tx - crop, ty - crop
+
+offsets = [(0.0, 0.0), (0.25, 0.5), (0.5, 0.75), (-0.9, 0.1), (1.7, -0.3), (-0.1, 1.6)]
+
+def test_hist_sky():
+    rng = np.random.default_rng(1)
+    raw = np.clip(rng.normal(40, 3, (60, 60)), 0, 255).astype(np.uint8)
+    bg, sigma = cent.sky(raw)
+    assert abs(bg - 40) <= 1
+    assert abs(sigma - 3) < 0.4
+    # flat sky still gives a usable noise
+    assert cent.sky(np.full((10, 10), 7, np.uint8)) == (7, 1.0)
+
+# median works in whole pixels, the others sub-pixel
+@pytest.mark.parametrize("method, tolerance", [(cent.MEDIAN, 1.0), (cent.INTERP, 0.25),
+                                               (cent.WEIGHTED, 0.1), (cent.MOMENTS, 0.1)])
+def test_estimator_error(method, tolerance):
+    for i, (dx, dy) in enumerate(offsets):
+        lit, raw, ta, tb = window(crop + dx, crop + dy, seed=i)
+        a, b, q, flux = cent.locate(method, lit, raw, crop, int(lit.sum()))
+        assert abs(a - ta) <= tolerance, (dx, dy)
+        assert abs(b - tb) <= tolerance, (dx, dy)
+
+def test_snr_and_flux():
+    last = 0
+    for flux in (1000.0, 2000.0, 4000.0):
+        lit, raw, ta, tb = window(crop + 0.3, crop - 0.2, flux)
+        bg, sigma = cent.sky(raw)
+        q, f = cent.snr(lit, raw, bg, sigma)
+        # the wings under the threshold are left out
+        assert 0.7 * flux < f <= flux
+        assert abs(q - f / (sigma * np.sqrt(lit.sum()))) < 1e-9
+        assert q > last
+        last = q
+        for method in range(4):
+            assert cent.locate(method, lit, raw, crop, int(lit.sum()))[2:] == pytest.approx((q, f))
+
+def test_nothing_lit():
+    raw = np.full((crop*2, crop*2), 20, np.uint8)
+    lit = np.zeros_like(raw)
+    for method in (cent.INTERP, cent.WEIGHTED, cent.MOMENTS):
+        assert cent.locate(method, lit, raw, crop, 0) == (0.0, 0.0, 0.0, 0.0)
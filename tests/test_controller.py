@@ -0,0 +1,65 @@
+import controller as ctl
+
+def test_average_every_interval():
+    c = ctl.make(ctl.AVERAGE, interval=3)
+    out = [c.update(e) for e in [1.0, 2.0, 3.0, 2.0, 5.0]]
+    assert out[:3] == [None, None, None]
+    assert out[3] == 2.0
+    assert out[4] is None
+
+def test_per_frame_modes_correct_every_frame():
+    for mode in (ctl.PROPORTIONAL, ctl.PID, ctl.HYSTERESIS):
+        c = ctl.make(mode, aggression=0.5)
+        assert all(c.update(1.0) is not None for i in range(5))
+
+def test_proportional():
+    c = ctl.make(ctl.PROPORTIONAL, aggression=0.7)
+    assert abs(c.update(2.0) - 1.4) < 1e-9
+
+def test_hysteresis_filters_with_last():
+    c = ctl.make(ctl.HYSTERESIS, aggression=1.0, hysteresis=0.5)
+    assert c.update(2.0) == 1.0
+    assert c.update(2.0) == 1.5
+    c.reset()
+    assert c.update(2.0) == 1.0
+
+class Clock:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+# a mount drifting 0.3 px a frame is held near the lock point
+def test_closed_loop():
+    for mode in (ctl.PROPORTIONAL, ctl.PID, ctl.HYSTERESIS):
+        clock = Clock()
+        c = ctl.make(mode, aggression=0.7, clock=clock)
+        pos = 0.0
+        for i in range(200):
+            clock.t += 0.2
+            pos += 0.3
+            pos -= c.update(pos)
+        assert abs(pos) < 1.0, ctl.names[mode]
+
+# the same error for the same time gives the same I and D terms at any fps
+def test_pid_scaled_by_interval():
+    for fps in (2, 5, 25):
+        clock = Clock()
+        i_only = ctl.Pid(aggression=0, ki=0.5, kd=0, clock=clock)
+        d_only = ctl.Pid(aggression=0, ki=0, kd=0.04, clock=clock)
+        for n in range(fps * 2 + 1):
+            # error growing 1 px a second
+            i_out = i_only.update(1.0)
+            d_out = d_only.update(clock.t - 100.0)
+            clock.t += 1 / fps
+        assert abs(i_out - 0.5 * 2) < 1e-9, fps
+        assert abs(d_out - 0.04) < 1e-9, fps
+
+def test_pid_integral_window():
+    clock = Clock()
+    c = ctl.Pid(aggression=0, ki=1.0, kd=0, window=4.0, clock=clock)
+    for n in range(100):
+        out = c.update(1.0)
+        clock.t += 0.1
+    assert abs(out - 4.0) < 0.11
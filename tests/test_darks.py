@@ -0,0 +1,25 @@
+import numpy as np
+
+from darks import DarkBuilder, Darks
+
+def test_hot_pixels_xrgb():
+    rng = np.random.default_rng(1)
+    builder = DarkBuilder(frames=4)
+    for i in range(4):
+        frame = rng.integers(8, 13, (48, 64, 4)).astype(np.uint8)
+        frame[..., 3] = 255
+        frame[10, 20, :3] = 200
+        builder.add(frame)
+    dark, hot = builder.master()
+    assert hot == 1
+    assert list(dark[10, 20]) == [255, 255, 255, 0]
+    assert not dark[..., 3].any()
+
+    darks = Darks()
+    darks.dark = dark
+    frame = np.full((48, 64, 4), 40, np.uint8)
+    frame[..., 3] = 255
+    darks.apply(frame, (0, 0, 64, 48))
+    assert not frame[10, 20, :3].any()
+    assert (frame[..., 3] == 255).all()
+    assert 27 <= frame[30, 30, 0] <= 32
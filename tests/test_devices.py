@@ -0,0 +1,87 @@
+import errno
+import json
+import os
+
+import devices
+import v4l2
+from replay import FakeV4L2
+
+def sysfs(tmp_path, nodes):
+    root = tmp_path / "video4linux"
+    for n, name, index in nodes:
+        d = root / ("video%d" % n)
+        d.mkdir(parents=True)
+        (d / "name").write_text(name + "\n")
+        (d / "index").write_text("%d\n" % index)
+    return str(root)
+
+class Opener:
+    def __init__(self, cameras):
+        self.cameras = cameras
+        self.opened = []
+
+    def __call__(self, n):
+        self.opened.append(n)
+        if n not in self.cameras:
+            raise OSError(errno.ENOTTY, "not a camera")
+        classes = ("User Controls", "Camera Controls") if self.cameras[n] else ("User Controls",)
+        return v4l2.Controls(None, ioctl=FakeV4L2([("Gain", 0, 100, 1, 35)], classes))
+
+def test_video_devices_first_nodes_first(tmp_path):
+    root = sysfs(tmp_path, [(11, "bcm2835-isp", 1), (10, "bcm2835-isp", 0), (2, "USB Cam", 1), (1, "USB Cam", 0)])
+    assert devices.video_devices(root) == [(1, "USB Cam"), (10, "bcm2835-isp"), (2, "USB Cam"), (11, "bcm2835-isp")]
+
+def test_find_camera_scans_and_caches(tmp_path):
+    root = sysfs(tmp_path, [(0, "unicam", 0), (1, "ISP", 0), (3, "USB Cam", 0)])
+    cache = str(tmp_path / "devices.json")
+    opener = Opener({1: False, 3: True})
+    assert devices.find_camera(opener, root, cache) == 3
+    assert opener.opened == [0, 1, 3]
+    assert json.load(open(cache))['camera'] == {'n': 3, 'name': "USB Cam"}
+
+def test_find_camera_cache_hit(tmp_path):
+    root = sysfs(tmp_path, [(0, "unicam", 0), (1, "ISP", 0), (3, "USB Cam", 0)])
+    cache = str(tmp_path / "devices.json")
+    devices.save_cache(cache, camera={'n': 3, 'name': "USB Cam"})
+    opener = Opener({3: True})
+    assert devices.find_camera(opener, root, cache) == 3
+    assert opener.opened == [3]
+
+def test_find_camera_cache_miss(tmp_path):
+    # the camera came back as video4 after a replug
+    root = sysfs(tmp_path, [(0, "unicam", 0), (4, "USB Cam", 0)])
+    cache = str(tmp_path / "devices.json")
+    devices.save_cache(cache, camera={'n': 3, 'name': "USB Cam"}, serial="/dev/ttyACM0")
+    opener = Opener({4: True})
+    assert devices.find_camera(opener, root, cache) == 4
+    saved = json.load(open(cache))
+    assert saved['camera'] == {'n': 4, 'name': "USB Cam"}
+    assert saved['serial'] == "/dev/ttyACM0"
+    assert devices.find_camera(Opener({}), root, cache) == -1
+
+def test_find_serial_prefers_by_id(tmp_path):
+    dev = tmp_path / "dev"
+    (dev / "serial" / "by-id").mkdir(parents=True)
+    for name in ("ttyACM0", "ttyACM1", "ttyUSB0"):
+        (dev / name).write_text("")
+    os.symlink("../../ttyACM1", str(dev / "serial" / "by-id" / "usb-Arduino_Uno-if00"))
+    os.symlink("../../ttyUSB0", str(dev / "serial" / "by-id" / "usb-FTDI-if00"))
+    cache = str(tmp_path / "devices.json")
+    port = devices.find_serial(str(dev), cache)
+    assert port == str(dev / "serial" / "by-id" / "usb-Arduino_Uno-if00")
+    assert json.load(open(cache))['serial'] == port
+    # cached, and still there
+    (dev / "serial" / "by-id" / "usb-FTDI-if00").unlink()
+    assert devices.find_serial(str(dev), cache) == port
+
+def test_find_serial_fallback(tmp_path):
+    dev = tmp_path / "dev"
+    dev.mkdir()
+    cache = str(tmp_path / "devices.json")
+    assert devices.find_serial(str(dev), cache) is None
+    (dev / "ttyACM1").write_text("")
+    (dev / "ttyACM0").write_text("")
+    assert devices.find_serial(str(dev), cache) == str(dev / "ttyACM0")
+    # the cached port has gone
+    (dev / "ttyACM0").unlink()
+    assert devices.find_serial(str(dev), cache) == str(dev / "ttyACM1")
@@ -0,0 +1,25 @@
+import numpy as np
+
+import centroid as cent
+from engine import GuideEngine
+from imgproc import circle_mask
+
+def star(crop, x, y, flux=3000.0, fwhm=3.0):
+    n = crop * 2
+    r = np.arange(n) + 0.5
+    s = fwhm / 2.3548
+    p = np.exp(-((r[None,:] - x)**2 + (r[:,None] - y)**2) / (2 * s * s))
+    rng = np.random.default_rng(0)
+    img = 20 + flux * p / p.sum() + rng.normal(0, 2, (n, n))
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+# with the circle mask and binning the lit pixels outside the circle count too
+def test_ttot_masked_binned():
+    crop = 20
+    for binn in (1, 2):
+        for centroid in (cent.MEDIAN, cent.INTERP):
+            engine = GuideEngine(crop=crop, c_mask=1, binn=binn, centroid=centroid)
+            r = engine.process(star(crop, 33.0, 33.0))
+            outside = r.lit[circle_mask(crop) == 0]
+            assert outside.any()
+            assert r.ttot == np.count_nonzero(r.lit)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from imgproc import bin_sum, noise_filter
+
+# the per-pixel loops PiAGL.py used before, ar6 as it allocated it
+def old_bin(gray, binn, crop):
+    ar6 = np.zeros((crop*2,crop*2), np.uint16)
+    for x1 in range (binn , (crop*2)-binn):
+        for y1 in range (binn , (crop*2)-binn):
+            ar6[x1][y1] = np.sum(gray[x1-binn:x1+1,y1-binn:y1+1])
+    if np.max(ar6) > 255:
+        ar6[ar6 >= 255] = 255
+    return ar6
+
+def old_noise(gray, noise, crop):
+    ar6 = np.zeros((crop*2,crop*2), np.uint16)
+    for x1 in range (noise , (crop*2)-noise):
+        for y1 in range (noise , (crop*2)-noise):
+            ar6[x1][y1] = np.sum(gray[x1-noise:x1,y1-noise:y1])
+    cx = int(noise*noise)
+    ar6[ar6 < cx] = 0
+    ar6[ar6 >= cx] = 1
+    return ar6
+
+@pytest.mark.parametrize("crop", [10, 23, 60])
+@pytest.mark.parametrize("binn", [1, 2, 3])
+def test_bin_sum(crop, binn):
+    rng = np.random.default_rng(crop * 10 + binn)
+    # a dim background, so some blocks stay under 255, and bright spots to clip
+    gray = rng.integers(0, 40, (crop*2, crop*2)).astype(np.uint8)
+    gray[rng.random(gray.shape) < 0.05] = 250
+    want = old_bin(gray, binn, crop)
+    assert want.max() == 255 and (want[binn:-binn,binn:-binn] < 255).any()
+    out = bin_sum(gray, binn, np.zeros((crop*2, crop*2), np.uint16))
+    assert np.array_equal(out, want)
+
+@pytest.mark.parametrize("crop", [10, 23, 60])
+@pytest.mark.parametrize("noise", [1, 2, 3])
+def test_noise_filter(crop, noise):
+    rng = np.random.default_rng(crop * 10 + noise)
+    lit = (rng.random((crop*2, crop*2)) < 0.7).astype(np.uint8)
+    lit[crop-5:crop+5,crop-5:crop+5] = 1
+    want = old_noise(lit, noise, crop)
+    assert want.any()
+    out = noise_filter(lit, noise, np.ones((crop*2, crop*2), np.uint8))
+    assert np.array_equal(out, want)
@@ -0,0 +1,50 @@
+import json
+import threading
+
+import settings
+from settings import Settings
+
+def test_legacy_bad_line(tmp_path):
+    old = tmp_path / "PiAGLconfig.txt"
+    lines = [str(settings.schema[name][0]) for name in settings.legacy]
+    lines[0] = "45"
+    lines[3] = "x"
+    lines[5] = "90000"
+    old.write_text("\n".join(lines) + "\n")
+    store = Settings(str(tmp_path / "s.json"), str(old))
+    assert store['crop'] == 45
+    assert store['fps'] == settings.schema['fps'][0]
+    assert store['speed'] == 90000
+    store.stop()
+    saved = json.loads((tmp_path / "s.json").read_text())
+    assert saved['settings']['crop'] == 45
+
+def test_limits_and_debounce(tmp_path):
+    store = Settings(str(tmp_path / "s.json"), str(tmp_path / "none.txt"), delay=0.05)
+    store.start()
+    for i in range(20):
+        store.update(crop=20 + i)
+    store.update(threshold=999)
+    assert store['threshold'] == 255
+    assert store.limit('exposure', 1, 50) == 50
+    store.stop()
+    saved = json.loads((tmp_path / "s.json").read_text())
+    assert saved['settings']['crop'] == 39
+    assert store.writes <= 2
+
+def test_writes_at_once(tmp_path):
+    store = Settings(str(tmp_path / "s.json"), str(tmp_path / "none.txt"))
+    errors = []
+    def writer():
+        try:
+            for i in range(100):
+                store.write()
+        except OSError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=writer) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert json.loads((tmp_path / "s.json").read_text())['version'] == settings.version
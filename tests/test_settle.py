@@ -0,0 +1,35 @@
+import time
+
+from capture import FrameGrabber
+from mount import SerialWriter
+from replay import RecordingSerial
+
+def test_settled_counts_spacing_and_both_pulses():
+    ser = RecordingSerial()
+    writer = SerialWriter(ser, spacing=0.1)
+    # DEC goes out 0.1 s after RA, so it ends last
+    t0 = time.monotonic()
+    writer.guide(":Mgw0200")
+    writer.guide(":Mgs0300")
+    assert abs(writer.settled() - (t0 + 0.4)) < 0.02
+    writer.start()
+    while len(ser.log) < 2:
+        time.sleep(0.01)
+    assert abs(writer.settled() - (ser.log[1][0] + 0.3)) < 0.01
+    # manual moves aren't pulses
+    writer.send(":Q#")
+    assert writer.settled() < ser.log[1][0] + 0.31
+    writer.stop()
+
+def test_frames_compared_by_exposure_start():
+    settle = time.monotonic() + 0.05
+    # frame 1 arrives after the mount has stopped, but was exposed before
+    frames = [(1, settle - 0.1), (2, settle + 0.01)]
+    def grab():
+        time.sleep(0.1)
+        return frames.pop(0) if frames else (3, time.monotonic())
+    grabber = FrameGrabber(grab, stamped=True)
+    grabber.start()
+    t, frame = grabber.latest(settle, timeout=1)
+    grabber.stop()
+    assert frame == 2
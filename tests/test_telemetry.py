@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+from telemetry import Telemetry, pulse_ms
+
+def test_pulse_ms():
+    assert pulse_ms(":Mgw0250") == 250
+    assert pulse_ms(":Mge0250") == -250
+    assert pulse_ms(":Mgn0040") == -40
+    assert pulse_ms("") == 0
+
+def test_ring_buffer_drops_oldest(tmp_path):
+    log = Telemetry(str(tmp_path / "log.csv"), size=8)
+    for i in range(20):
+        log.record(i, 0, 0, 0, 0, 0, 1, 0, 0, 0)
+    rows = log.pending()
+    assert list(rows['t']) == list(range(12, 20))
+    assert log.dropped == 12
+
+def test_rotation(tmp_path):
+    path = str(tmp_path / "log.csv")
+    log = Telemetry(path, size=64, max_bytes=500, keep=3)
+    for n in range(6):
+        for i in range(20):
+            log.record(n * 20 + i, 1.5, -2.25, 1000, 20, 40, 1, 120, -80, 0.01)
+        log.flush()
+    names = sorted(os.listdir(str(tmp_path)))
+    assert names == ["log.1.csv", "log.2.csv", "log.csv"]
+    with open(path) as f:
+        assert f.readline().startswith("t,x,y,flux")
+    data = np.loadtxt(path, delimiter=',', skiprows=1)
+    assert data[-1, 0] == 119
+    assert data[-1, 7] == 120 and data[-1, 8] == -80
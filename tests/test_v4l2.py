@@ -0,0 +1,41 @@
+import errno
+
+import v4l2
+from replay import FakeV4L2
+
+rows = [("Brightness", -64, 64, 1, 0),
+        ("Gain", 0, 100, 1, 35),
+        ("Restore User Settings", 0, 0, 0, 0, v4l2.V4L2_CTRL_TYPE_BUTTON, v4l2.V4L2_CTRL_FLAG_WRITE_ONLY),
+        ("Auto Exposure", 0, 3, 1, 3, v4l2.V4L2_CTRL_TYPE_MENU),
+        ("Exposure Time, Absolute", 1, 5000, 1, 157)]
+
+def test_unreadable_controls_skipped():
+    fake = FakeV4L2(rows)
+    ctrls = v4l2.Controls(None, ioctl=fake)
+    assert 'restore_user_settings' not in ctrls
+    assert 'auto_exposure' in ctrls
+    fake.fail("Gain", v4l2.VIDIOC_G_CTRL, errno.EACCES)
+    params = ctrls.parameters()
+    names = params[::6]
+    assert names == ['brightness', 'auto_exposure', 'exposure_time_absolute']
+    assert params[names.index('exposure_time_absolute') * 6 + 5] == 157
+
+def test_set_refused():
+    fake = FakeV4L2(rows)
+    ctrls = v4l2.Controls(None, ioctl=fake)
+    fake.fail("Exposure Time, Absolute", v4l2.VIDIOC_S_CTRL, errno.EACCES)
+    assert not ctrls.set('exposure_time_absolute', 300)
+    assert fake.value("Exposure Time, Absolute") == 157
+    assert ctrls.set('gain', 50)
+    assert fake.value("Gain") == 50
+
+def test_set_many_refused():
+    fake = FakeV4L2(rows)
+    ctrls = v4l2.Controls(None, ioctl=fake)
+    fake.fail("Exposure Time, Absolute", v4l2.VIDIOC_S_CTRL, errno.EBUSY)
+    ctrls.set_many(auto_exposure=1, exposure_time_absolute=300, gain=60)
+    # the others are still set one at a time
+    assert fake.value("Auto Exposure") == 1
+    assert fake.value("Exposure Time, Absolute") == 157
+    assert fake.value("Gain") == 60
+    assert fake.calls.count(v4l2.VIDIOC_S_CTRL) == 3
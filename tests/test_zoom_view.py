@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+import pytest
+
+import centroid as cent
+from engine import GuideEngine, pick_star
+from imgproc import zoom_view
+from starfield import StarField
+
+widths = [640, 800, 960, 1280, 1620, 1920, 2592, 3280]
+
+# the view as PiAGL.py made it before zoom_view, the whole frame resized
+def old_view(img, dim, x, y):
+    return cv2.resize(img, dim, interpolation=cv2.INTER_AREA)[y:y+362,x:x+640]
+
+# INTER_AREA enlarges almost like nearest neighbour and zoom_view
+# interpolates linearly, so the star's profile changes a little and each
+# estimator moves by a different amount. Median and interp snap to whole or
+# half pixels, so a few frames flip by a step, but on average all of them
+# must agree. Limits are max, mean and bias of the difference in pixels,
+# from what this field gives with some margin.
+@pytest.mark.parametrize("centroid, most, mean, bias", [(cent.MEDIAN, 1.0, 0.18, 0.05),
+                                                        (cent.INTERP, 0.85, 0.17, 0.05),
+                                                        (cent.WEIGHTED, 0.7, 0.12, 0.03),
+                                                        (cent.MOMENTS, 0.1, 0.015, 0.005)])
+def test_zoom_view_guiding(centroid, most, mean, bias):
+    field = StarField(stars=3, fwhm=5, drift=(0.05, 0.03), seed=3)
+    frames = [field.frame(n)[0] for n in range(12)]
+    diffs = []
+    for zoom in range(7):
+        w = widths[zoom]
+        h = int(w/1.7647)
+        x = int((w/2) - 320)
+        y = int((h/2) - 181)
+        a, b = pick_star(old_view(frames[0], (w, h), x, y), 30)
+        old = GuideEngine(crop=30, centroid=centroid, Auto_G=1)
+        new = GuideEngine(crop=30, centroid=centroid, Auto_G=1)
+        for img in frames:
+            r1 = old.process(old.window(old_view(img, (w, h), x, y), a, b))
+            r2 = new.process(new.window(zoom_view(img, (w, h), x, y), a, b))
+            assert r1.found and r2.found
+            diffs += [r2.acorrect - r1.acorrect, r2.bcorrect - r1.bcorrect]
+    diffs = np.array(diffs)
+    assert np.abs(diffs).max() <= most + 1e-9
+    assert np.abs(diffs).mean() <= mean
+    assert abs(diffs.mean()) <= bias
+    # most frames agree to within half a step
+    assert np.mean(np.abs(diffs) > 0.5) <= 0.15
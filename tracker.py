@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# detection window that follows the star.
+# An alpha-beta filter on the star's position predicts where it will be in
+# the next frame, and only a small window around that is processed. If the
+# star is missing for 'max_lost' frames the full size window at the lock
+# point a,b is used until it is found again.
+# Positions are in view pixels, x right and y down like a,b.
+
+class Tracker:
+    def __init__(self, track_crop=15, alpha=0.5, beta=0.1, max_lost=5):
+        self.track_crop = track_crop
+        self.alpha      = alpha
+        self.beta       = beta
+        self.max_lost   = max_lost
+        self.lock       = None
+        self.reset()
+
+    def reset(self):
+        self.x    = None
+        self.y    = None
+        self.vx   = 0.0
+        self.vy   = 0.0
+        self.lost = 0
+        self.wide = True
+
+    # window centre and crop for the next frame, for a lock point a,b
+    def window(self, a, b, crop, width=640, height=362):
+        if self.lock != (a, b, crop):
+            self.lock = (a, b, crop)
+            self.reset()
+        if self.wide or self.x is None:
+            return a, b, crop
+        c = min(self.track_crop, crop)
+        wa = int(round(self.x + self.vx))
+        wb = int(round(self.y + self.vy))
+        wa = min(max(wa, c + 1), width - c - 1)
+        wb = min(max(wb, c + 1), height - c - 1)
+        return wa, wb, c
+
+    # star position measured this frame, or found False
+    def update(self, found, x=0.0, y=0.0):
+        if not found:
+            self.lost += 1
+            if self.x is not None:
+                # coast on the last velocity
+                self.x += self.vx
+                self.y += self.vy
+            if self.lost >= self.max_lost:
+                self.reset()
+            return
+        self.lost = 0
+        if self.x is None or self.wide:
+            self.x, self.y = x, y
+            self.vx = self.vy = 0.0
+            self.wide = False
+            return
+        px = self.x + self.vx
+        py = self.y + self.vy
+        rx = x - px
+        ry = y - py
+        self.x = px + self.alpha * rx
+        self.y = py + self.alpha * ry
+        self.vx += self.beta * rx
+        self.vy += self.beta * ry
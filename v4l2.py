@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+# USB camera controls and capture straight through V4L2 ioctls on an open
+# /dev/videoN, instead of running v4l2-ctl for each change or going through
+# pygame.camera.
+# Controls are listed once with VIDIOC_QUERYCTRL and kept by the same names
+# v4l2-ctl uses (eg exposure_time_absolute). set() is one VIDIOC_S_CTRL,
+# set_many() sends several in one VIDIOC_S_EXT_CTRLS.
+# Capture streams from driver buffers mapped into memory, so each frame is
+# copied once, straight into the array handed on.
+# The ioctl function can be replaced, eg by replay.FakeV4L2, to run without
+# a camera.
+
+import ctypes
+import errno
+import fcntl
+import mmap
+import os
+import select
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+def _IOWR(nr, size):
+    return (3 << 30) | (size << 16) | (ord('V') << 8) | nr
+
+def _IOW(nr, size):
+    return (1 << 30) | (size << 16) | (ord('V') << 8) | nr
+
+def fourcc(code):
+    return ord(code[0]) | (ord(code[1]) << 8) | (ord(code[2]) << 16) | (ord(code[3]) << 24)
+
+class v4l2_queryctrl(ctypes.Structure):
+    _fields_ = [('id', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('name', ctypes.c_char * 32),
+                ('minimum', ctypes.c_int32),
+                ('maximum', ctypes.c_int32),
+                ('step', ctypes.c_int32),
+                ('default_value', ctypes.c_int32),
+                ('flags', ctypes.c_uint32),
+                ('reserved', ctypes.c_uint32 * 2)]
+
+class v4l2_control(ctypes.Structure):
+    _fields_ = [('id', ctypes.c_uint32),
+                ('value', ctypes.c_int32)]
+
+class v4l2_ext_value(ctypes.Union):
+    _pack_ = 1
+    _fields_ = [('value', ctypes.c_int32),
+                ('value64', ctypes.c_int64),
+                ('ptr', ctypes.c_void_p)]
+
+class v4l2_ext_control(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [('id', ctypes.c_uint32),
+                ('size', ctypes.c_uint32),
+                ('reserved2', ctypes.c_uint32),
+                ('u', v4l2_ext_value)]
+
+class v4l2_ext_controls(ctypes.Structure):
+    _fields_ = [('which', ctypes.c_uint32),
+                ('count', ctypes.c_uint32),
+                ('error_idx', ctypes.c_uint32),
+                ('request_fd', ctypes.c_int32),
+                ('reserved', ctypes.c_uint32),
+                ('controls', ctypes.POINTER(v4l2_ext_control))]
+
+class v4l2_pix_format(ctypes.Structure):
+    _fields_ = [('width', ctypes.c_uint32),
+                ('height', ctypes.c_uint32),
+                ('pixelformat', ctypes.c_uint32),
+                ('field', ctypes.c_uint32),
+                ('bytesperline', ctypes.c_uint32),
+                ('sizeimage', ctypes.c_uint32),
+                ('colorspace', ctypes.c_uint32),
+                ('priv', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('ycbcr_enc', ctypes.c_uint32),
+                ('quantization', ctypes.c_uint32),
+                ('xfer_func', ctypes.c_uint32)]
+
+# the union holds pointers in the kernel, which sets its alignment
+class v4l2_format_fmt(ctypes.Union):
+    _fields_ = [('pix', v4l2_pix_format),
+                ('raw_data', ctypes.c_uint8 * 200),
+                ('align', ctypes.c_void_p)]
+
+class v4l2_format(ctypes.Structure):
+    _fields_ = [('type', ctypes.c_uint32),
+                ('fmt', v4l2_format_fmt)]
+
+class v4l2_requestbuffers(ctypes.Structure):
+    _fields_ = [('count', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('memory', ctypes.c_uint32),
+                ('capabilities', ctypes.c_uint32),
+                ('flags', ctypes.c_uint8),
+                ('reserved', ctypes.c_uint8 * 3)]
+
+class timeval(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long),
+                ('tv_usec', ctypes.c_long)]
+
+class v4l2_timecode(ctypes.Structure):
+    _fields_ = [('type', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('frames', ctypes.c_uint8),
+                ('seconds', ctypes.c_uint8),
+                ('minutes', ctypes.c_uint8),
+                ('hours', ctypes.c_uint8),
+                ('userbits', ctypes.c_uint8 * 4)]
+
+class v4l2_buffer_m(ctypes.Union):
+    _fields_ = [('offset', ctypes.c_uint32),
+                ('userptr', ctypes.c_ulong),
+                ('planes', ctypes.c_void_p),
+                ('fd', ctypes.c_int32)]
+
+class v4l2_buffer(ctypes.Structure):
+    _fields_ = [('index', ctypes.c_uint32),
+                ('type', ctypes.c_uint32),
+                ('bytesused', ctypes.c_uint32),
+                ('flags', ctypes.c_uint32),
+                ('field', ctypes.c_uint32),
+                ('timestamp', timeval),
+                ('timecode', v4l2_timecode),
+                ('sequence', ctypes.c_uint32),
+                ('memory', ctypes.c_uint32),
+                ('m', v4l2_buffer_m),
+                ('length', ctypes.c_uint32),
+                ('reserved2', ctypes.c_uint32),
+                ('request_fd', ctypes.c_int32)]
+
+VIDIOC_S_FMT       = _IOWR(5, ctypes.sizeof(v4l2_format))
+VIDIOC_REQBUFS     = _IOWR(8, ctypes.sizeof(v4l2_requestbuffers))
+VIDIOC_QUERYBUF    = _IOWR(9, ctypes.sizeof(v4l2_buffer))
+VIDIOC_QBUF        = _IOWR(15, ctypes.sizeof(v4l2_buffer))
+VIDIOC_DQBUF       = _IOWR(17, ctypes.sizeof(v4l2_buffer))
+VIDIOC_STREAMON    = _IOW(18, ctypes.sizeof(ctypes.c_int))
+VIDIOC_STREAMOFF   = _IOW(19, ctypes.sizeof(ctypes.c_int))
+VIDIOC_G_CTRL      = _IOWR(27, ctypes.sizeof(v4l2_control))
+VIDIOC_S_CTRL      = _IOWR(28, ctypes.sizeof(v4l2_control))
+VIDIOC_QUERYCTRL   = _IOWR(36, ctypes.sizeof(v4l2_queryctrl))
+VIDIOC_S_EXT_CTRLS = _IOWR(72, ctypes.sizeof(v4l2_ext_controls))
+
+V4L2_CTRL_FLAG_DISABLED  = 0x0001
+V4L2_CTRL_FLAG_WRITE_ONLY = 0x0040
+V4L2_CTRL_FLAG_NEXT_CTRL = 0x80000000
+V4L2_CTRL_TYPE_INTEGER   = 1
+V4L2_CTRL_TYPE_BOOLEAN   = 2
+V4L2_CTRL_TYPE_MENU      = 3
+V4L2_CTRL_TYPE_BUTTON    = 4
+V4L2_CTRL_TYPE_CTRL_CLASS = 6
+V4L2_CTRL_TYPE_INTEGER_MENU = 9
+# controls with one integer value that G_CTRL/S_CTRL can read and set
+value_types = (V4L2_CTRL_TYPE_INTEGER, V4L2_CTRL_TYPE_BOOLEAN, V4L2_CTRL_TYPE_MENU, V4L2_CTRL_TYPE_INTEGER_MENU)
+V4L2_CTRL_WHICH_CUR_VAL  = 0
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_MEMORY_MMAP = 1
+V4L2_BUF_FLAG_TIMESTAMP_MASK = 0xe000
+V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC = 0x2000
+V4L2_FIELD_ANY   = 0
+V4L2_PIX_FMT_YUYV  = fourcc('YUYV')
+V4L2_PIX_FMT_MJPEG = fourcc('MJPG')
+
+# control name as v4l2-ctl shows it, "Exposure Time, Absolute" -> exposure_time_absolute
+def var_name(name):
+    out = ""
+    gap = False
+    for c in name:
+        if c.isalnum():
+            if gap:
+                out += "_"
+            gap = False
+            out += c.lower()
+        elif out:
+            gap = True
+    return out
+
+class Control:
+    def __init__(self, q):
+        self.id      = q.id
+        self.type    = q.type
+        self.label   = q.name.decode('ascii', 'replace')
+        self.minimum = q.minimum
+        self.maximum = q.maximum
+        self.step    = max(q.step, 1)
+        self.default = q.default_value
+        self.flags   = q.flags
+
+    # value moved onto the control's range and steps
+    def clamp(self, value):
+        value = min(max(int(value), self.minimum), self.maximum)
+        return value - (value - self.minimum) % self.step
+
+class Controls:
+    def __init__(self, device, ioctl=fcntl.ioctl):
+        self.ioctl = ioctl
+        if isinstance(device, int):
+            device = "/dev/video%d" % device
+        self.path = device
+        self.fd = -1
+        if ioctl is fcntl.ioctl:
+            self.fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
+        self.ctrls = OrderedDict()
+        self.classes = []
+        self.query()
+
+    def query(self):
+        q = v4l2_queryctrl()
+        q.id = V4L2_CTRL_FLAG_NEXT_CTRL
+        while True:
+            try:
+                self.ioctl(self.fd, VIDIOC_QUERYCTRL, q)
+            except OSError as e:
+                if e.errno == errno.EINVAL:
+                    break
+                raise
+            if q.type == V4L2_CTRL_TYPE_CTRL_CLASS:
+                self.classes.append(q.name.decode('ascii', 'replace'))
+            # buttons, strings, arrays and write only controls have no value to read
+            elif q.type in value_types and not q.flags & (V4L2_CTRL_FLAG_DISABLED | V4L2_CTRL_FLAG_WRITE_ONLY):
+                c = Control(q)
+                self.ctrls[var_name(c.label)] = c
+            q.id |= V4L2_CTRL_FLAG_NEXT_CTRL
+
+    def __contains__(self, name):
+        return name in self.ctrls
+
+    def get(self, name):
+        c = v4l2_control(self.ctrls[name].id, 0)
+        self.ioctl(self.fd, VIDIOC_G_CTRL, c)
+        return c.value
+
+    # a control the camera refuses (busy, or locked by auto exposure) is
+    # reported and left as it was, returns whether it was set
+    def set(self, name, value):
+        ctrl = self.ctrls.get(name)
+        if ctrl is None:
+            return False
+        try:
+            self.ioctl(self.fd, VIDIOC_S_CTRL, v4l2_control(ctrl.id, ctrl.clamp(value)))
+        except OSError as e:
+            print("camera control", ctrl.label, "not set:", e)
+            return False
+        return True
+
+    # several controls in one call, ones the camera hasn't got are skipped
+    def set_many(self, **values):
+        items = [(self.ctrls[k], v) for k, v in values.items() if k in self.ctrls]
+        if not items:
+            return
+        arr = (v4l2_ext_control * len(items))()
+        for i, (ctrl, value) in enumerate(items):
+            arr[i].id = ctrl.id
+            arr[i].u.value = ctrl.clamp(value)
+        ext = v4l2_ext_controls(which=V4L2_CTRL_WHICH_CUR_VAL, count=len(items), controls=arr)
+        try:
+            self.ioctl(self.fd, VIDIOC_S_EXT_CTRLS, ext)
+        except OSError:
+            # older drivers, or one control refused, one at a time
+            for name in values:
+                self.set(name, values[name])
+
+    # [name, min, max, step, default, value] for each control, like camera_controls() made
+    def parameters(self):
+        out = []
+        for name, c in self.ctrls.items():
+            try:
+                value = self.get(name)
+            except OSError as e:
+                print("camera control", c.label, "not read:", e)
+                continue
+            out += [name, c.minimum, c.maximum, c.step, c.default, value]
+        return out
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+# frames from a USB camera, RGB or with gray just the luminance, flipped
+# bottom row first like the surfarray/rot90 frames PiAGL.py used to make.
+# fmt is 'MJPG' (less USB bandwidth, decoded here) or 'YUYV' (no decoding,
+# luminance is every other byte). If the camera can't do the format asked
+# for, the one the driver picks is used if it is one of these.
+class Capture:
+    def __init__(self, device, width=640, height=480, fmt='MJPG', gray=False, buffers=4,
+                 ioctl=fcntl.ioctl, mapper=mmap.mmap, timeout=2.0):
+        self.ioctl   = ioctl
+        self.gray    = gray
+        self.timeout = timeout
+        self.stamp   = 0.0   # time.monotonic() the driver stamped the last frame
+        if isinstance(device, int):
+            device = "/dev/video%d" % device
+        self.fd = -1
+        if ioctl is fcntl.ioctl:
+            self.fd = os.open(device, os.O_RDWR)
+        f = v4l2_format()
+        f.type = V4L2_BUF_TYPE_VIDEO_CAPTURE
+        f.fmt.pix.width = width
+        f.fmt.pix.height = height
+        f.fmt.pix.pixelformat = fourcc(fmt)
+        f.fmt.pix.field = V4L2_FIELD_ANY
+        self.ioctl(self.fd, VIDIOC_S_FMT, f)
+        self.width  = f.fmt.pix.width
+        self.height = f.fmt.pix.height
+        self.format = f.fmt.pix.pixelformat
+        self.stride = f.fmt.pix.bytesperline or self.width * 2
+        if self.format not in (V4L2_PIX_FMT_YUYV, V4L2_PIX_FMT_MJPEG):
+            self.close()
+            raise OSError(errno.EINVAL, "camera has no MJPG or YUYV format")
+        req = v4l2_requestbuffers(count=buffers, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+        self.ioctl(self.fd, VIDIOC_REQBUFS, req)
+        self.maps = []
+        for i in range(req.count):
+            buf = self.buffer(i)
+            self.ioctl(self.fd, VIDIOC_QUERYBUF, buf)
+            self.maps.append(mapper(self.fd, buf.length, mmap.MAP_SHARED, mmap.PROT_READ, offset=buf.m.offset))
+            self.ioctl(self.fd, VIDIOC_QBUF, buf)
+        self.ioctl(self.fd, VIDIOC_STREAMON, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+
+    def buffer(self, i=0):
+        return v4l2_buffer(index=i, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+
+    # next frame as a new contiguous array
+    def read(self):
+        while True:
+            if self.fd >= 0 and not select.select([self.fd], [], [], self.timeout)[0]:
+                raise OSError(errno.ETIMEDOUT, "no frame from camera")
+            buf = self.buffer()
+            self.ioctl(self.fd, VIDIOC_DQBUF, buf)
+            # UVC stamps the start of the frame's transfer, after its exposure
+            if buf.flags & V4L2_BUF_FLAG_TIMESTAMP_MASK == V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC:
+                self.stamp = buf.timestamp.tv_sec + buf.timestamp.tv_usec / 1e6
+            else:
+                self.stamp = time.monotonic()
+            try:
+                frame = self.convert(np.frombuffer(self.maps[buf.index], np.uint8, buf.bytesused))
+            finally:
+                self.ioctl(self.fd, VIDIOC_QBUF, buf)
+            if frame is not None:
+                return frame
+
+    def convert(self, data):
+        h, w = self.height, self.width
+        if self.format == V4L2_PIX_FMT_YUYV:
+            yuyv = data[:h * self.stride].reshape(h, self.stride)[:, :w * 2]
+            if self.gray:
+                out = np.empty((h, w), np.uint8)
+                np.copyto(out, yuyv[::-1, ::2])
+                return out
+            out = cv2.cvtColor(yuyv.reshape(h, w, 2), cv2.COLOR_YUV2RGB_YUYV)
+            cv2.flip(out, 0, dst=out)
+            return out
+        # MJPG, a damaged frame is skipped
+        if self.gray:
+            out = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+        else:
+            out = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if out is None:
+            return None
+        if not self.gray:
+            cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+        cv2.flip(out, 0, dst=out)
+        return out
+
+    def close(self):
+        if getattr(self, 'maps', None):
+            try:
+                self.ioctl(self.fd, VIDIOC_STREAMOFF, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+            except OSError:
+                pass
+            for m in self.maps:
+                m.close()
+            self.maps = []
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1